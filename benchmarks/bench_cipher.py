@@ -0,0 +1,88 @@
+"""Benchmark encode/decode throughput with and without cipher caching.
+
+"uncached" rebuilds an AESCipher per message like TuyaProtocol used to,
+"cached" reuses a single AESCipher and "protocol" goes through TuyaProtocol._encode_message/_decode_payload which
+reuse the cipher cached for the current key.
+
+Usage: python benchmarks/bench_cipher.py
+"""
+import asyncio
+import json
+
+from util import bench, load_pytuya
+
+pytuya = load_pytuya()
+
+DEV_ID = "bf0123456789abcdef01"
+LOCAL_KEY = "0123456789abcdef"
+COUNT = 20000
+PAYLOAD = json.dumps({"devId": DEV_ID, "dps": {"1": True, "18": 120}}).encode()
+
+
+def make_protocol(version):
+    """Return a protocol instance that is not connected to anything."""
+    loop = asyncio.get_running_loop()
+    return pytuya.TuyaProtocol(
+        DEV_ID,
+        LOCAL_KEY,
+        version,
+        False,
+        loop.create_future(),
+        pytuya.EmptyListener(),
+    )
+
+
+async def run(version):
+    """Benchmark a protocol version."""
+    protocol = make_protocol(version)
+    key = protocol.local_key
+    message = pytuya.MessagePayload(pytuya.CONTROL, PAYLOAD)
+    encrypted = pytuya.AESCipher(key).encrypt(PAYLOAD, False)
+
+    bench(
+        f"{version} uncached encrypt",
+        lambda: pytuya.AESCipher(key).encrypt(PAYLOAD, False),
+        COUNT,
+        unit="msg",
+    )
+    bench(
+        f"{version} uncached decrypt",
+        lambda: pytuya.AESCipher(key).decrypt(encrypted, False),
+        COUNT,
+        unit="msg",
+    )
+    cipher = protocol._get_cipher()
+    bench(
+        f"{version} cached encrypt",
+        lambda: cipher.encrypt(PAYLOAD, False),
+        COUNT,
+        unit="msg",
+    )
+    bench(
+        f"{version} cached decrypt",
+        lambda: cipher.decrypt(encrypted, False),
+        COUNT,
+        unit="msg",
+    )
+    bench(
+        f"{version} protocol encode",
+        lambda: protocol._encode_message(message),
+        COUNT,
+        unit="msg",
+    )
+    bench(
+        f"{version} protocol decode",
+        lambda: protocol._decode_payload(encrypted),
+        COUNT,
+        unit="msg",
+    )
+
+
+async def main():
+    """Run all benchmarks."""
+    for version in (3.3, 3.4):
+        await run(version)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
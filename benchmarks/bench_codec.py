@@ -0,0 +1,81 @@
+"""Benchmark pack_message/unpack_message/parse_header.
+
+Checks that frames survive a pack/unpack round trip, then reports frames
+per second for typical 3.1, 3.3 (CRC32) and 3.4 (HMAC) frames.
+
+Usage: python benchmarks/bench_codec.py
+"""
+import logging
+
+from util import bench, load_pytuya
+
+pytuya = load_pytuya()
+
+COUNT = 50000
+KEY = b"0123456789abcdef"
+LOGGER = logging.getLogger(__name__)
+
+FRAMES = {
+    # 3.1 sends plain JSON for everything but CONTROL
+    "3.1": (b'{"gwId":"bf0123456789abcdef01","devId":"bf0123456789abcdef01"}', None),
+    "3.3": (pytuya.PROTOCOL_33_HEADER + b"x" * 112, None),
+    "3.4": (b"x" * 128, KEY),
+}
+
+
+def check():
+    """Verify that packed frames unpack to the same message."""
+    for version, (payload, hmac_key) in FRAMES.items():
+        msg = pytuya.TuyaMessage(7, pytuya.CONTROL, 0, payload, 0, True)
+        frame = pytuya.pack_message(msg, hmac_key=hmac_key)
+
+        header = pytuya.parse_header(frame)
+        assert header.seqno == 7 and header.cmd == pytuya.CONTROL, (version, header)
+        assert len(frame) == pytuya.MESSAGE_HEADER_LEN + header.length, version
+
+        # pack_message writes no return code, unlike device responses
+        unpacked = pytuya.unpack_message(
+            frame, hmac_key=hmac_key, no_retcode=True, logger=LOGGER
+        )
+        assert unpacked.seqno == 7 and unpacked.cmd == pytuya.CONTROL, version
+        assert unpacked.payload == payload, version
+        assert unpacked.crc_good, version
+
+        corrupted = bytearray(frame)
+        corrupted[pytuya.MESSAGE_HEADER_LEN] ^= 0xFF
+        unpacked = pytuya.unpack_message(
+            bytes(corrupted), hmac_key=hmac_key, no_retcode=True, logger=LOGGER
+        )
+        assert not unpacked.crc_good, version
+    print(f"{len(FRAMES)} protocol versions round-trip")
+
+
+def run(version, payload, hmac_key):
+    """Benchmark a protocol version."""
+    msg = pytuya.TuyaMessage(1, pytuya.CONTROL, 0, payload, 0, True)
+    frame = pytuya.pack_message(msg, hmac_key=hmac_key)
+
+    bench(
+        f"{version} pack_message",
+        lambda: pytuya.pack_message(msg, hmac_key=hmac_key),
+        COUNT,
+        unit="frame",
+    )
+    bench(
+        f"{version} parse_header",
+        lambda: pytuya.parse_header(frame),
+        COUNT,
+        unit="frame",
+    )
+    bench(
+        f"{version} unpack_message",
+        lambda: pytuya.unpack_message(frame, hmac_key=hmac_key, logger=LOGGER),
+        COUNT,
+        unit="frame",
+    )
+
+
+if __name__ == "__main__":
+    check()
+    for protocol_version, (frame_payload, key) in FRAMES.items():
+        run(protocol_version, frame_payload, key)
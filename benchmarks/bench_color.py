@@ -0,0 +1,141 @@
+"""Check and benchmark the colour DP codec of lights.
+
+Verifies that colours survive a decode/encode round trip in both
+encodings and that encoding matches the string formatting light.py used
+before, then compares parsing and formatting with the cached codec.
+
+Usage: python benchmarks/bench_color.py
+"""
+import colorsys
+import textwrap
+
+from util import bench, load_color_codec
+
+codec = load_color_codec()
+
+COUNT = 100000
+# A bulb in music mode cycling through a few colours
+PUSHED = ["00ff00007855ff", "ff000000005aff", "0000ff00f05aff"]
+HSV_PUSHED = ["000003e803e8", "007803e801f4", "00f003e80064"]
+
+
+def legacy_decode(color):
+    """Parse a colour the way status_updated used to."""
+    if len(color) > 12:
+        hue = int(color[6:10], 16)
+        sat = int(color[10:12], 16)
+        value = int(color[12:14], 16)
+        return hue, sat * 100 / 255, value
+    hue, sat, value = [int(value, 16) for value in textwrap.wrap(color, 4)]
+    return hue, sat / 10.0, value
+
+
+def legacy_encode(hue, sat, brightness, upper_brightness, rgb_encoded):
+    """Format a colour the way async_turn_on used to."""
+    if rgb_encoded:
+        rgb = [
+            int(c * 255)
+            for c in colorsys.hsv_to_rgb(
+                hue / 360, sat / 100, int(brightness * 100 / upper_brightness) / 100
+            )
+        ]
+        return "{:02x}{:02x}{:02x}{:04x}{:02x}{:02x}".format(
+            round(rgb[0]),
+            round(rgb[1]),
+            round(rgb[2]),
+            round(hue),
+            round(sat * 255 / 100),
+            brightness,
+        )
+    return "{:04x}{:04x}{:04x}".format(round(hue), round(sat * 10.0), brightness)
+
+
+def encode_colors(colors, upper_brightness, rgb_encoded):
+    """Encode (hue, saturation, brightness) tuples for a group of lights.
+
+    Each distinct colour is encoded once, however many lights share it.
+    """
+    encoded = {}
+    result = []
+    for color in colors:
+        value = encoded.get(color)
+        if value is None:
+            value = encoded[color] = codec.encode_color(
+                *color, upper_brightness, rgb_encoded
+            )
+        result.append(value)
+    return result
+
+
+def check():
+    """Verify round trips and compatibility with the legacy formatting."""
+    checked = 0
+    for rgb_encoded, upper, brightness_range in (
+        (True, 255, range(25, 256, 23)),
+        (False, 1000, range(10, 1001, 99)),
+    ):
+        for hue in range(0, 361, 7):
+            for sat in (0, 12.5, 33, 50, 87.3, 100):
+                for brightness in brightness_range:
+                    args = (hue, sat, brightness, upper, rgb_encoded)
+                    color = codec.encode_color(*args)
+                    assert color == legacy_encode(*args), (args, color)
+                    assert codec.is_rgb_encoded(color) == rgb_encoded
+                    decoded = codec.decode_color(color)
+                    assert decoded == legacy_decode(color), (color, decoded)
+                    assert decoded[0] == hue and decoded[2] == brightness, decoded
+                    assert abs(decoded[1] - sat) <= (0.2 if rgb_encoded else 0.05)
+                    # The RGB part is derived from the quantized saturation
+                    again = codec.encode_color(*decoded, upper, rgb_encoded)
+                    start = 6 if rgb_encoded else 0
+                    assert again[start:] == color[start:], (color, again)
+                    checked += 1
+    assert codec.decode_color("zz") is None
+    assert codec.decode_color("12345") is None
+    assert (
+        encode_colors([(10, 50, 100)] * 3, 1000, False)
+        == [codec.encode_color(10, 50, 100, 1000, False)] * 3
+    )
+    print(f"{checked} colours round-trip")
+
+
+def main():
+    """Run the checks and benchmarks."""
+    check()
+    for name, pushed in (("rgb+hsv", PUSHED), ("hsv", HSV_PUSHED)):
+        bench(
+            f"decode {name} legacy",
+            lambda p=pushed: [legacy_decode(color) for color in p],
+            COUNT,
+            unit="push",
+        )
+        bench(
+            f"decode {name} codec",
+            lambda p=pushed: [codec.decode_color(color) for color in p],
+            COUNT,
+            unit="push",
+        )
+    for name, rgb_encoded, upper in (("rgb+hsv", True, 255), ("hsv", False, 1000)):
+        bench(
+            f"encode {name} legacy",
+            lambda r=rgb_encoded, u=upper: legacy_encode(120.5, 80.2, 200, u, r),
+            COUNT,
+            unit="msg",
+        )
+        bench(
+            f"encode {name} codec",
+            lambda r=rgb_encoded, u=upper: codec.encode_color(120.5, 80.2, 200, u, r),
+            COUNT,
+            unit="msg",
+        )
+    group = [(30, 60, 300)] * 40
+    bench(
+        "encode 40 bulb group",
+        lambda: encode_colors(group, 1000, False),
+        COUNT // 10,
+        unit="group",
+    )
+
+
+if __name__ == "__main__":
+    main()
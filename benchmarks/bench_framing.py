@@ -0,0 +1,68 @@
+"""Microbenchmark for MessageDispatcher framing.
+
+Feeds the dispatcher with fragmented (small TCP segments) and coalesced
+(many frames per segment) streams and reports frames parsed per second.
+
+Usage: python benchmarks/bench_framing.py
+"""
+from util import bench, load_pytuya
+
+pytuya = load_pytuya()
+
+DEV_ID = "bf0123456789abcdef01"
+KEY = b"0123456789abcdef"
+FRAMES = 200
+
+
+def build_stream(version):
+    """Return a byte stream of FRAMES status frames."""
+    hmac_key = KEY if version == 3.4 else None
+    payload = b"\x00\x00\x00\x00" + b"x" * 120
+    return b"".join(
+        pytuya.pack_message(
+            pytuya.TuyaMessage(seqno, pytuya.STATUS, 0, payload, 0, True),
+            hmac_key=hmac_key,
+        )
+        for seqno in range(FRAMES)
+    )
+
+
+def make_dispatcher(version):
+    """Return a dispatcher that drops every parsed message."""
+    dispatcher = pytuya.MessageDispatcher(DEV_ID, None, version, KEY, False)
+    dispatcher._dispatch = lambda msg: None
+    return dispatcher
+
+
+def run(version):
+    """Benchmark a protocol version."""
+    stream = build_stream(version)
+    dispatcher = make_dispatcher(version)
+
+    def coalesced():
+        dispatcher.add_data(stream)
+
+    fragments = [stream[i : i + 7] for i in range(0, len(stream), 7)]
+
+    def fragmented():
+        for fragment in fragments:
+            dispatcher.add_data(fragment)
+
+    segments = [stream[i : i + 1460] for i in range(0, len(stream), 1460)]
+
+    def mtu_sized():
+        for segment in segments:
+            dispatcher.add_data(segment)
+
+    for name, func, count in (
+        ("coalesced", coalesced, 200),
+        ("mtu sized segments", mtu_sized, 200),
+        ("fragmented (7 byte segments)", fragmented, 20),
+    ):
+        elapsed = bench(f"{version} {name}", func, count, unit="stream")
+        print(f"{'':<40} {count * FRAMES / elapsed:>12,.0f} frame/s")
+
+
+if __name__ == "__main__":
+    for protocol_version in (3.3, 3.4):
+        run(protocol_version)
@@ -0,0 +1,73 @@
+"""Benchmark JSON payload generation for common commands.
+
+"legacy" rebuilds the payload dict and serializes it with json.dumps and
+.replace(" ", "") like _generate_payload used to, "template" goes through
+TuyaProtocol._generate_payload which renders a compiled payload template.
+
+Usage: python benchmarks/bench_payload.py
+"""
+import asyncio
+import json
+import time
+
+from util import bench, load_pytuya
+
+pytuya = load_pytuya()
+
+DEV_ID = "bf0123456789abcdef01"
+LOCAL_KEY = "0123456789abcdef"
+COUNT = 50000
+DPS = {"1": True, "2": 50, "3": "colour", "5": "ff00000000ffff"}
+
+
+def legacy_payload(json_data, data=None):
+    """Build a payload the way _generate_payload used to."""
+    json_data = dict(json_data)
+    for field in ("gwId", "devId", "uid"):
+        if field in json_data:
+            json_data[field] = DEV_ID
+    if "t" in json_data:
+        json_data["t"] = str(int(time.time()))
+    if data is not None:
+        json_data["dps"] = data
+    return json.dumps(json_data).replace(" ", "").encode("utf-8")
+
+
+async def main():
+    """Run all benchmarks."""
+    loop = asyncio.get_running_loop()
+    protocol = pytuya.TuyaProtocol(
+        DEV_ID, LOCAL_KEY, 3.3, False, loop.create_future(), pytuya.EmptyListener()
+    )
+    commands = pytuya.payload_dict["type_0a"]
+
+    for name, command, data in (
+        ("heartbeat", pytuya.HEART_BEAT, None),
+        ("dp_query", pytuya.DP_QUERY, None),
+        ("control", pytuya.CONTROL, DPS),
+    ):
+        template = commands[command]["command"]
+        bench(
+            f"{name} legacy",
+            lambda t=template, d=data: legacy_payload(t, d),
+            COUNT,
+            unit="msg",
+        )
+        bench(
+            f"{name} template",
+            lambda c=command, d=data: protocol._generate_payload(c, d),
+            COUNT,
+            unit="msg",
+        )
+
+    encoded = pytuya.encode_dps(DPS)
+    bench(
+        "control template (pre-encoded dps)",
+        lambda: protocol._generate_payload(pytuya.CONTROL, encoded),
+        COUNT,
+        unit="msg",
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
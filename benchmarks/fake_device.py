@@ -0,0 +1,302 @@
+"""Simulated Tuya devices speaking the local protocol.
+
+Every TCP connection accepted by a FakeDeviceServer behaves like one device
+using protocol 3.1, 3.3 or 3.4: it negotiates 3.4 session keys, answers
+heartbeats, DP_QUERY and CONTROL commands and pushes unsolicited STATUS
+updates. Responses can be delayed, split into small TCP segments or dropped
+to simulate slow, fragmenting or lossy networks.
+
+Usage: python benchmarks/fake_device.py [--version 3.3] [--port 6668] ...
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import random
+import socket
+import time
+from hashlib import md5, sha256
+
+from util import load_pytuya
+
+pytuya = load_pytuya()
+
+LOCAL_KEY = b"0123456789abcdef"
+DEFAULT_DPS = {"1": True, "2": 50, "3": "colour", "5": "ff00000000ffff"}
+
+# Seconds between the TCP segments of a fragmented message
+FRAGMENT_GAP = 0.0005
+
+
+class FakeDevice(asyncio.Protocol):
+    """One simulated device on one connection."""
+
+    def __init__(self, server):
+        """Initialize a device with the settings of its server."""
+        self.server = server
+        self.version = server.version
+        self.real_key = server.local_key
+        self.key = self.real_key
+        self.dps = dict(server.dps)
+        self.transport = None
+        self.buffer = b""
+        self.seqno = 1
+        self.local_nonce = b""
+        self.remote_nonce = b""
+        self.push_handle = None
+        self.next_write = 0
+
+    def connection_made(self, transport):
+        """Start pushing status updates if configured and not using 3.4."""
+        self.transport = transport
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.connections += 1
+        if self.version != 3.4:
+            self._schedule_push()
+
+    def connection_lost(self, exc):
+        """Stop pushing status updates."""
+        self.server.connections -= 1
+        if self.push_handle is not None:
+            self.push_handle.cancel()
+
+    def data_received(self, data):
+        """Handle all complete frames received so far."""
+        self.buffer += data
+        while len(self.buffer) >= pytuya.MESSAGE_HEADER_LEN:
+            header = pytuya.parse_header(self.buffer)
+            end = pytuya.MESSAGE_HEADER_LEN + header.length
+            if len(self.buffer) < end:
+                return
+            frame, self.buffer = self.buffer[:end], self.buffer[end:]
+            hmac_key = self.key if self.version == 3.4 else None
+            try:
+                msg = pytuya.unpack_message(
+                    frame, hmac_key=hmac_key, no_retcode=True, logger=pytuya._LOGGER
+                )
+                self._handle(msg)
+            except Exception:  # pylint: disable=broad-except
+                # Real devices drop connections they cannot make sense of
+                self.transport.close()
+                return
+
+    def _handle(self, msg):
+        """Answer a request."""
+        self.server.requests += 1
+        if msg.cmd == pytuya.SESS_KEY_NEG_START:
+            cipher = pytuya.AESCipher(self.real_key)
+            self.key = self.real_key
+            self.local_nonce = cipher.decrypt(msg.payload, False, decode_text=False)
+            self.remote_nonce = random.randbytes(16)
+            digest = hmac.new(self.real_key, self.local_nonce, sha256).digest()
+            self._reply(msg, pytuya.SESS_KEY_NEG_RESP, self.remote_nonce + digest)
+        elif msg.cmd == pytuya.SESS_KEY_NEG_FINISH:
+            session_key = bytes(
+                a ^ b for a, b in zip(self.local_nonce, self.remote_nonce)
+            )
+            cipher = pytuya.AESCipher(self.real_key)
+            self.key = cipher.encrypt(session_key, False, pad=False)
+            # 3.4 devices only push updates within a session
+            if self.push_handle is None:
+                self._schedule_push()
+        elif msg.cmd == pytuya.HEART_BEAT:
+            self._reply(msg, msg.cmd, b"")
+        elif msg.cmd in (pytuya.DP_QUERY, pytuya.DP_QUERY_NEW):
+            self._reply(msg, msg.cmd, self._status_json())
+        elif msg.cmd in (pytuya.CONTROL, pytuya.CONTROL_NEW):
+            request = self._decrypt_request(msg)
+            dps = request.get("dps") or request.get("data", {}).get("dps", {})
+            self.dps.update(dps)
+            self._reply(msg, msg.cmd, b"")
+            self._send(0, pytuya.STATUS, self._status_json(dps))
+        else:
+            self._reply(msg, msg.cmd, b"")
+
+    def _decrypt_request(self, msg):
+        """Return the JSON payload of a request."""
+        payload = msg.payload
+        if self.version == 3.4:
+            payload = pytuya.AESCipher(self.key).decrypt(
+                payload, False, decode_text=False
+            )
+            if payload.startswith(b"3.4"):
+                payload = payload[len(pytuya.PROTOCOL_34_HEADER) :]
+        elif self.version == 3.3:
+            if payload.startswith(b"3.3"):
+                payload = payload[len(pytuya.PROTOCOL_33_HEADER) :]
+            payload = pytuya.AESCipher(self.key).decrypt(
+                payload, False, decode_text=False
+            )
+        elif payload.startswith(pytuya.PROTOCOL_VERSION_BYTES_31):
+            payload = payload[len(pytuya.PROTOCOL_VERSION_BYTES_31) + 16 :]
+            payload = pytuya.AESCipher(self.key).decrypt(payload, decode_text=False)
+        return json.loads(payload)
+
+    def _status_json(self, dps=None):
+        """Return a status message body."""
+        dps = self.dps if dps is None else dps
+        if self.version == 3.4:
+            body = {"protocol": 4, "t": int(time.time()), "data": {"dps": dps}}
+        else:
+            body = {"devId": "fake", "dps": dps, "t": int(time.time())}
+        return json.dumps(body, separators=(",", ":")).encode()
+
+    def _encrypt_response(self, cmd, payload):
+        """Encrypt a response body like a device of this version would."""
+        if not payload:
+            return payload
+        if self.version == 3.4:
+            if cmd not in pytuya.NO_PROTOCOL_HEADER_CMDS:
+                payload = pytuya.PROTOCOL_34_HEADER + payload
+            return pytuya.AESCipher(self.key).encrypt(payload, False)
+        if self.version == 3.3:
+            payload = pytuya.AESCipher(self.key).encrypt(payload, False)
+            if cmd not in pytuya.NO_PROTOCOL_HEADER_CMDS:
+                payload = pytuya.PROTOCOL_33_HEADER + payload
+            return payload
+        if cmd == pytuya.STATUS:
+            payload = pytuya.AESCipher(self.key).encrypt(payload)
+            digest = md5(b"data=" + payload + b"||lpv=3.1||" + self.key).hexdigest()
+            return b"3.1" + digest[8:24].encode() + payload
+        return payload
+
+    def _reply(self, request, cmd, payload):
+        """Answer a request with its sequence number."""
+        if cmd == pytuya.SESS_KEY_NEG_RESP:
+            payload = pytuya.AESCipher(self.real_key).encrypt(payload, False)
+            self._send(request.seqno, cmd, payload, encrypted=True)
+        else:
+            self._send(request.seqno, cmd, payload)
+
+    def _send(self, seqno, cmd, payload, encrypted=False):
+        """Frame and send a message, subject to simulated network effects."""
+        if random.random() < self.server.loss:
+            self.server.dropped += 1
+            return
+        if not encrypted:
+            payload = self._encrypt_response(cmd, payload)
+        if seqno == 0:
+            seqno = self.seqno
+            self.seqno += 1
+        hmac_key = self.key if self.version == 3.4 else None
+        msg = pytuya.TuyaMessage(seqno, cmd, 0, b"\0\0\0\0" + payload, 0, True)
+        data = pytuya.pack_message(msg, hmac_key=hmac_key)
+        self.server.responses += 1
+
+        loop = asyncio.get_running_loop()
+        when = loop.time() + self.server.latency
+        if not self.server.fragment:
+            loop.call_at(when, self._write, data)
+            return
+        # Segments of a message must not interleave with those of the next one
+        when = max(when, self.next_write)
+        for offset in range(0, len(data), self.server.fragment):
+            loop.call_at(
+                when, self._write, data[offset : offset + self.server.fragment]
+            )
+            when += FRAGMENT_GAP
+        self.next_write = when
+
+    def _write(self, data):
+        if not self.transport.is_closing():
+            self.transport.write(data)
+
+    def _schedule_push(self):
+        if self.server.push_interval:
+            delay = self.server.push_interval * random.uniform(0.5, 1.5)
+            self.push_handle = asyncio.get_running_loop().call_later(delay, self._push)
+
+    def _push(self):
+        """Report a changed DP without being asked."""
+        self.dps["2"] = random.randint(10, 1000)
+        self._send(0, pytuya.STATUS, self._status_json({"2": self.dps["2"]}))
+        self._schedule_push()
+
+
+class FakeDeviceServer:
+    """Listening socket whose every connection is a simulated device."""
+
+    def __init__(
+        self,
+        version=3.3,
+        local_key=LOCAL_KEY,
+        dps=None,
+        latency=0,
+        fragment=0,
+        loss=0,
+        push_interval=0,
+    ):
+        """Initialize the server settings shared by all its devices."""
+        self.version = version
+        self.local_key = local_key
+        self.dps = DEFAULT_DPS if dps is None else dps
+        self.latency = latency
+        self.fragment = fragment
+        self.loss = loss
+        self.push_interval = push_interval
+        self.server = None
+        self.connections = 0
+        self.requests = 0
+        self.responses = 0
+        self.dropped = 0
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start listening, return the port."""
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(
+            lambda: FakeDevice(self), host, port, backlog=1024
+        )
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop listening."""
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def add_arguments(parser):
+    """Add the options of simulated devices to an argument parser."""
+    parser.add_argument("--version", type=float, default=3.3, choices=[3.1, 3.3, 3.4])
+    parser.add_argument("--latency", type=float, default=0, help="seconds")
+    parser.add_argument(
+        "--fragment", type=int, default=0, help="max bytes per TCP segment"
+    )
+    parser.add_argument("--loss", type=float, default=0, help="response drop rate")
+    parser.add_argument(
+        "--push-interval", type=float, default=0, help="mean seconds between pushes"
+    )
+
+
+def server_from_args(args):
+    """Create a server from parsed arguments."""
+    return FakeDeviceServer(
+        version=args.version,
+        latency=args.latency,
+        fragment=args.fragment,
+        loss=args.loss,
+        push_interval=args.push_interval,
+    )
+
+
+async def main():
+    """Run a fake device server until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    add_arguments(parser)
+    parser.add_argument("--port", type=int, default=6668)
+    args = parser.parse_args()
+
+    server = server_from_args(args)
+    port = await server.start("0.0.0.0", args.port)
+    print(f"Fake {args.version} devices on port {port}, key {LOCAL_KEY.decode()}")
+    while True:
+        await asyncio.sleep(10)
+        print(
+            f"{server.connections} connections, {server.requests} requests, "
+            f"{server.responses} responses, {server.dropped} dropped"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+"""Load test pytuya against a fleet of simulated devices.
+
+Starts a FakeDeviceServer in a child process, connects N pytuya clients to
+it and sends each of them a mix of status, set_dp and heartbeat commands.
+Reports connect time and command round trip percentiles, client CPU time
+per command and memory per connection.
+
+Usage: python benchmarks/load_test.py [--devices 200] [--commands 20] ...
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+import tracemalloc
+
+from fake_device import LOCAL_KEY, add_arguments, server_from_args
+from util import load_pytuya
+
+pytuya = load_pytuya()
+
+COMMANDS = ("status", "set_dp", "heartbeat")
+
+
+class CountingListener(pytuya.TuyaListener):
+    """Listener counting status updates pushed by a device."""
+
+    def __init__(self):
+        """Initialize the counters."""
+        self.updates = 0
+        self.disconnects = 0
+
+    def status_updated(self, status):
+        """Device updated status."""
+        self.updates += 1
+
+    def disconnected(self):
+        """Device disconnected."""
+        self.disconnects += 1
+
+
+def percentiles(samples):
+    """Return a summary of latencies in milliseconds."""
+    if not samples:
+        return "no samples"
+    samples = sorted(samples)
+
+    def pick(fraction):
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+    return (
+        f"p50 {pick(0.5):7.2f}  p90 {pick(0.9):7.2f}  p99 {pick(0.99):7.2f}  "
+        f"max {samples[-1] * 1000:7.2f} ms  (n={len(samples)})"
+    )
+
+
+def run_server(args, ports):
+    """Serve simulated devices in a child process."""
+
+    async def serve():
+        server = server_from_args(args)
+        ports.put(await server.start())
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+async def connect_device(index, port, args, semaphore, listeners):
+    """Connect a client and fetch the initial status, return it and the time."""
+    listener = CountingListener()
+    listeners.append(listener)
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            protocol = await pytuya.connect(
+                "127.0.0.1",
+                f"fake{index:016d}",
+                LOCAL_KEY.decode(),
+                args.version,
+                False,
+                listener,
+                port=port,
+            )
+            await protocol.status()
+        except Exception as ex:  # pylint: disable=broad-except
+            print(f"Device {index} failed to connect: {ex!r}")
+            return None, None
+        return protocol, time.perf_counter() - start
+
+
+async def run_commands(protocol, count, rtts):
+    """Send count commands to a device, recording round trips by command."""
+    for i in range(count):
+        command = COMMANDS[i % len(COMMANDS)]
+        start = time.perf_counter()
+        try:
+            if command == "status":
+                await protocol.status()
+            elif command == "set_dp":
+                await protocol.set_dp(i, "2")
+            else:
+                await protocol.heartbeat()
+        except Exception:  # pylint: disable=broad-except
+            rtts["failed"].append(time.perf_counter() - start)
+            continue
+        rtts[command].append(time.perf_counter() - start)
+
+
+async def main():
+    """Run the load test."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    add_arguments(parser)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--commands", type=int, default=20, help="per device")
+    parser.add_argument(
+        "--concurrency", type=int, default=50, help="simultaneous connects"
+    )
+    args = parser.parse_args()
+
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=run_server, args=(args, ports))
+    server.daemon = True
+    server.start()
+    port = ports.get()
+
+    listeners = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            connect_device(i, port, args, semaphore, listeners)
+            for i in range(args.devices)
+        )
+    )
+    ramp = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    protocols = [protocol for protocol, _ in results if protocol is not None]
+    connect_times = [elapsed for _, elapsed in results if elapsed is not None]
+    print(
+        f"protocol {args.version}, {len(protocols)}/{args.devices} devices "
+        f"connected in {ramp:.2f}s"
+    )
+    print(f"{'connect':<10} {percentiles(connect_times)}")
+    if protocols:
+        print(f"{'memory':<10} {memory / len(protocols) / 1024:.1f} KiB/connection")
+
+    rtts = {command: [] for command in COMMANDS + ("failed",)}
+    cpu = time.process_time()
+    start = time.perf_counter()
+    await asyncio.gather(*(run_commands(p, args.commands, rtts) for p in protocols))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    sent = sum(len(samples) for samples in rtts.values())
+    for command, samples in rtts.items():
+        if samples:
+            print(f"{command:<10} {percentiles(samples)}")
+    if sent:
+        print(
+            f"{'commands':<10} {sent / elapsed:,.0f}/s, "
+            f"{cpu / sent * 1e6:.1f} us client CPU per command"
+        )
+    print(f"{'pushes':<10} {sum(listener.updates for listener in listeners)}")
+
+    await asyncio.gather(*(protocol.close() for protocol in protocols))
+    server.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
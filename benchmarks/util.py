@@ -0,0 +1,49 @@
+"""Helpers shared by the pytuya benchmarks."""
+import importlib.util
+import sys
+import time
+from pathlib import Path
+
+LOCALTUYA_DIR = Path(__file__).parent.parent / "custom_components" / "localtuya"
+PYTUYA_DIR = LOCALTUYA_DIR / "pytuya"
+
+
+def load_pytuya():
+    """Import pytuya without importing the Home Assistant integration."""
+    if "pytuya" in sys.modules:
+        return sys.modules["pytuya"]
+    spec = importlib.util.spec_from_file_location(
+        "pytuya",
+        PYTUYA_DIR / "__init__.py",
+        submodule_search_locations=[str(PYTUYA_DIR)],
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["pytuya"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_color_codec():
+    """Import color_codec without importing the Home Assistant integration."""
+    if "color_codec" in sys.modules:
+        return sys.modules["color_codec"]
+    spec = importlib.util.spec_from_file_location(
+        "color_codec", LOCALTUYA_DIR / "color_codec.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["color_codec"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench(name, func, count, unit="op"):
+    """Run func count times and print throughput."""
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<40} {count / elapsed:>12,.0f} {unit}/s "
+        f"{elapsed / count * 1e6:>8.2f} us/{unit}"
+    )
+    return elapsed
@@ -16,31 +16,45 @@ from homeassistant.const import (
     CONF_ENTITIES,
     CONF_HOST,
     CONF_ID,
-    CONF_PLATFORM,
     CONF_REGION,
     CONF_USERNAME,
     EVENT_HOMEASSISTANT_STOP,
     SERVICE_RELOAD,
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, SupportsResponse
 from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers.device_registry import DeviceEntry
 from homeassistant.helpers.event import async_track_time_interval
 
+from . import pytuya
 from .cloud_api import TuyaCloudApi
-from .common import TuyaDevice, async_config_entry_by_device_id
+from .common import (
+    DeviceIndex,
+    TuyaDevice,
+    async_config_entry_by_device_id,
+    async_is_persisted_device_config,
+    async_persist_device_config,
+    async_update_device_config,
+)
 from .config_flow import ENTRIES_VERSION, config_schema
+from .connection_manager import ConnectionManager
 from .const import (
     ATTR_UPDATED_AT,
     CONF_NO_CLOUD,
     CONF_PRODUCT_KEY,
     CONF_USER_ID,
     DATA_CLOUD,
+    DATA_CONNECTION_MANAGER,
+    DATA_DEVICE_INDEX,
     DATA_DISCOVERY,
+    DATA_PROFILES,
+    DATA_SCENES,
     DOMAIN,
     TUYA_DEVICES,
 )
 from .discovery import TuyaDiscovery
+from .profiles import DeviceProfileStore
+from .scenes import CapturedSceneStore
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -51,6 +65,7 @@ RECONNECT_INTERVAL = timedelta(seconds=60)
 CONFIG_SCHEMA = config_schema()
 
 CONF_DP = "dp"
+CONF_DPS = "dps"
 CONF_VALUE = "value"
 
 SERVICE_SET_DP = "set_dp"
@@ -62,13 +77,25 @@ SERVICE_SET_DP_SCHEMA = vol.Schema(
     }
 )
 
+SERVICE_SET_DPS = "set_dps"
+SERVICE_SET_DPS_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_DEVICES): vol.All(cv.ensure_list, [cv.string]),
+        vol.Required(CONF_DPS): {vol.Coerce(int): object},
+    }
+)
+
 
 async def async_setup(hass: HomeAssistant, config: dict):
     """Set up the LocalTuya integration component."""
     hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN][TUYA_DEVICES] = {}
-
-    device_cache = {}
+    hass.data[DOMAIN][DATA_CONNECTION_MANAGER] = ConnectionManager(hass)
+    hass.data[DOMAIN][DATA_DEVICE_INDEX] = DeviceIndex()
+    hass.data[DOMAIN][DATA_PROFILES] = DeviceProfileStore(hass)
+    await hass.data[DOMAIN][DATA_PROFILES].async_load()
+    hass.data[DOMAIN][DATA_SCENES] = CapturedSceneStore(hass)
+    await hass.data[DOMAIN][DATA_SCENES].async_load()
 
     async def _handle_reload(service):
         """Handle reload service call."""
@@ -95,60 +122,76 @@ async def async_setup(hass: HomeAssistant, config: dict):
 
         await device.set_dp(event.data[CONF_VALUE], event.data[CONF_DP])
 
+    async def _handle_set_dps(call):
+        """Handle set_dps service call: send the same DPs to a group of devices.
+
+        The DPs are serialized once and sent to all devices concurrently.
+        Returns whether each device acknowledged them and how long it took.
+        """
+        dps = pytuya.encode_dps(
+            {str(dp): value for dp, value in call.data[CONF_DPS].items()}
+        )
+        devices = hass.data[DOMAIN][TUYA_DEVICES]
+
+        async def _send(dev_id):
+            device = devices.get(dev_id)
+            if device is None:
+                return {"success": False, "error": "unknown device id"}
+            if not device.connected:
+                return {"success": False, "error": "not connected to device"}
+            try:
+                elapsed = await device.send_dps(dps)
+            except Exception as ex:  # pylint: disable=broad-except
+                return {"success": False, "error": str(ex) or type(ex).__name__}
+            return {"success": True, "time": round(elapsed, 3)}
+
+        dev_ids = call.data[CONF_DEVICES]
+        results = await asyncio.gather(*(_send(dev_id) for dev_id in dev_ids))
+        return {CONF_DEVICES: dict(zip(dev_ids, results))}
+
     def _device_discovered(device):
         """Update address of device if it has changed."""
         device_ip = device["ip"]
         device_id = device["gwId"]
         product_key = device["productKey"]
 
-        # If device is not in cache, check if a config entry exists
         entry = async_config_entry_by_device_id(hass, device_id)
         if entry is None:
             return
 
-        if device_id not in device_cache:
-            if entry and device_id in entry.data[CONF_DEVICES]:
-                # Save address from config entry in cache to trigger
-                # potential update below
-                host_ip = entry.data[CONF_DEVICES][device_id][CONF_HOST]
-                device_cache[device_id] = host_ip
-
-        if device_id not in device_cache:
-            return
-
-        dev_entry = entry.data[CONF_DEVICES][device_id]
-
-        new_data = entry.data.copy()
-        updated = False
-
-        if device_cache[device_id] != device_ip:
-            updated = True
-            new_data[CONF_DEVICES][device_id][CONF_HOST] = device_ip
-            device_cache[device_id] = device_ip
-
+        dev_entry = hass.data[DOMAIN][DATA_DEVICE_INDEX].device_config(device_id)
+        updates = {}
+        if dev_entry[CONF_HOST] != device_ip:
+            updates[CONF_HOST] = device_ip
         if dev_entry.get(CONF_PRODUCT_KEY) != product_key:
-            updated = True
-            new_data[CONF_DEVICES][device_id][CONF_PRODUCT_KEY] = product_key
+            updates[CONF_PRODUCT_KEY] = product_key
 
-        # Update settings if something changed, otherwise try to connect. Updating
-        # settings triggers a reload of the config entry, which tears down the device
-        # so no need to connect in that case.
-        if updated:
+        # Changes are applied to the running device and persisted later on,
+        # without reloading the config entry and reconnecting all devices
+        if updates:
             _LOGGER.debug(
                 "Updating keys for device %s: %s %s", device_id, device_ip, product_key
             )
-            new_data[ATTR_UPDATED_AT] = str(int(time.time() * 1000))
-            hass.config_entries.async_update_entry(entry, data=new_data)
-   
+            async_update_device_config(hass, entry, device_id, updates)
         elif device_id in hass.data[DOMAIN][TUYA_DEVICES]:
             _LOGGER.debug("Device %s found with IP %s", device_id, device_ip)
 
         device = hass.data[DOMAIN][TUYA_DEVICES].get(device_id)
         if not device:
             _LOGGER.warning(f"Could not find device for device_id {device_id}")
-        elif not device.connected:
-            device.async_connect()
+        elif CONF_HOST not in updates and not device.connected:
+            # Device just announced itself, so it is likely to accept connections
+            device.async_connect(priority=True)
 
+    def _device_seen(device_id):
+        """Reconnect a known device which announced itself again.
+
+        Unchanged broadcasts repeat every few seconds, so they must not skip
+        the backoff of a device which keeps refusing connections.
+        """
+        device = hass.data[DOMAIN][TUYA_DEVICES].get(device_id)
+        if device is not None and not device.connected:
+            device.async_connect()
 
     def _shutdown(event):
         """Clean up resources when shutting down."""
@@ -172,7 +215,15 @@ async def async_setup(hass: HomeAssistant, config: dict):
         DOMAIN, SERVICE_SET_DP, _handle_set_dp, schema=SERVICE_SET_DP_SCHEMA
     )
 
-    discovery = TuyaDiscovery(_device_discovered)
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_SET_DPS,
+        _handle_set_dps,
+        schema=SERVICE_SET_DPS_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    discovery = TuyaDiscovery(_device_discovered, _device_seen)
     try:
         await discovery.start()
         hass.data[DOMAIN][DATA_DISCOVERY] = discovery
@@ -261,14 +312,17 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
             res = await tuya_api.async_get_devices_list()
     hass.data[DOMAIN][DATA_CLOUD] = tuya_api
 
+    device_index = hass.data[DOMAIN][DATA_DEVICE_INDEX]
+    device_index.async_index_entry(entry)
+
     async def setup_entities(device_ids):
-        platforms = set()
+        platforms = device_index.platforms(entry)
         for dev_id in device_ids:
-            entities = entry.data[CONF_DEVICES][dev_id][CONF_ENTITIES]
-            platforms = platforms.union(
-                set(entity[CONF_PLATFORM] for entity in entities)
-            )
             hass.data[DOMAIN][TUYA_DEVICES][dev_id] = TuyaDevice(hass, entry, dev_id)
+        discovery = hass.data[DOMAIN].get(DATA_DISCOVERY)
+        if discovery is not None:
+            # Apply addresses that changed while Home Assistant was down
+            discovery.replay(device_ids)
 
         await asyncio.gather(
             *[
@@ -292,11 +346,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Unload a config entry."""
-    platforms = {}
-
-    for dev_id, dev_entry in entry.data[CONF_DEVICES].items():
-        for entity in dev_entry[CONF_ENTITIES]:
-            platforms[entity[CONF_PLATFORM]] = True
+    platforms = hass.data[DOMAIN][DATA_DEVICE_INDEX].platforms(entry)
 
     unload_ok = all(
         await asyncio.gather(
@@ -308,18 +358,26 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     )
 
     hass.data[DOMAIN][entry.entry_id][UNSUB_LISTENER]()
-    for dev_id, device in hass.data[DOMAIN][TUYA_DEVICES].items():
-        if device.connected:
-            await device.close()
+    async_persist_device_config(hass, entry)
+    # Also close devices still queued, connecting or backing off, so the
+    # connection manager does not retry them after the entry is gone
+    await asyncio.gather(
+        *(device.close() for device in hass.data[DOMAIN][TUYA_DEVICES].values())
+    )
 
     if unload_ok:
         hass.data[DOMAIN][TUYA_DEVICES] = {}
+        hass.data[DOMAIN][DATA_DEVICE_INDEX].async_remove_entry(entry)
 
     return True
 
 
 async def update_listener(hass, config_entry):
     """Update listener."""
+    hass.data[DOMAIN][DATA_DEVICE_INDEX].async_index_entry(config_entry)
+    if async_is_persisted_device_config(hass, config_entry):
+        # Devices already run with the persisted changes
+        return
     await hass.config_entries.async_reload(config_entry.entry_id)
 
 
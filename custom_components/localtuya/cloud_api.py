@@ -1,15 +1,39 @@
 """Class to perform requests to Tuya Cloud APIs."""
-import functools
+import asyncio
 import hashlib
 import hmac
 import json
 import logging
 import time
 
-import requests
+import aiohttp
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
 _LOGGER = logging.getLogger(__name__)
 
+# Seconds before a request is given up
+REQUEST_TIMEOUT = 10
+
+# Attempts for requests failing with a server error or on the network, waiting
+# RETRY_BACKOFF * 2^(attempt - 1) seconds in between
+REQUEST_ATTEMPTS = 3
+RETRY_BACKOFF = 1
+
+# Seconds before its expiry at which the access token is refreshed
+TOKEN_REFRESH_MARGIN = 60
+
+# Error code of requests made with an invalid or expired access token
+ERR_TOKEN_INVALID = 1010
+
+# Devices requested per page of the device list
+DEVICE_PAGE_SIZE = 100
+
+# Seconds during which fetched device data is considered current
+DEVICE_CACHE_TTL = 60
+
+# Seconds to collect local key requests of several devices into one fetch
+KEY_FETCH_WINDOW = 0.5
+
 
 # Signature algorithm.
 def calc_sign(msg, key):
@@ -26,6 +50,24 @@ def calc_sign(msg, key):
     return sign
 
 
+class CloudResponse:
+    """Status and decoded JSON body of a cloud API response."""
+
+    def __init__(self, status, data):
+        """Initialize the response."""
+        self.status = status
+        self._data = data
+
+    @property
+    def ok(self):
+        """Return whether the request succeeded on the HTTP level."""
+        return self.status < 400
+
+    def json(self):
+        """Return the decoded body, None if it was not JSON."""
+        return self._data
+
+
 class TuyaCloudApi:
     """Class to send API calls."""
 
@@ -37,11 +79,21 @@ class TuyaCloudApi:
         self._secret = secret
         self._user_id = user_id
         self._access_token = ""
+        self._token_expires = 0
+        self._token_lock = asyncio.Lock()
+        self._session = async_get_clientsession(hass)
+        self._fetched = {}
+        self._key_requests = None
+        self._key_fetch = None
         self.device_list = {}
 
-    def generate_payload(self, method, timestamp, url, headers, body=None):
+    def generate_payload(
+        self, method, timestamp, url, headers, body=None, access_token=None
+    ):
         """Generate signed payload for requests."""
-        payload = self._client_id + self._access_token + timestamp
+        if access_token is None:
+            access_token = self._access_token
+        payload = self._client_id + access_token + timestamp
 
         payload += method + "\n"
         # Content-SHA256
@@ -62,48 +114,86 @@ class TuyaCloudApi:
         return payload
 
     async def async_make_request(self, method, url, body=None, headers={}):
-        """Perform requests."""
-        timestamp = str(int(time.time() * 1000))
-        payload = self.generate_payload(method, timestamp, url, headers, body)
-        default_par = {
-            "client_id": self._client_id,
-            "access_token": self._access_token,
-            "sign": calc_sign(payload, self._secret),
-            "t": timestamp,
-            "sign_method": "HMAC-SHA256",
-        }
+        """Perform requests.
+
+        Requests go through the shared HTTP session of Home Assistant and are
+        retried with backoff on server and network errors. A fresh access token
+        is obtained before the current one expires.
+        """
+        is_token_request = url.startswith("/v1.0/token")
+        if not is_token_request:
+            await self._async_ensure_token()
+        data = None if body is None else json.dumps(body)
         full_url = self._base_url + url
         # _LOGGER.debug("\n" + method + ": [%s]", full_url)
 
-        if method == "GET":
-            func = functools.partial(
-                requests.get, full_url, headers=dict(default_par, **headers)
-            )
-        elif method == "POST":
-            func = functools.partial(
-                requests.post,
-                full_url,
-                headers=dict(default_par, **headers),
-                data=json.dumps(body),
-            )
-            # _LOGGER.debug("BODY: [%s]", body)
-        elif method == "PUT":
-            func = functools.partial(
-                requests.put,
-                full_url,
-                headers=dict(default_par, **headers),
-                data=json.dumps(body),
+        for attempt in range(1, REQUEST_ATTEMPTS + 1):
+            token_revoked = False
+            # Token requests are signed without any access token
+            access_token = "" if is_token_request else self._access_token
+            timestamp = str(int(time.time() * 1000))
+            payload = self.generate_payload(
+                method, timestamp, url, headers, data, access_token
             )
+            default_par = {
+                "client_id": self._client_id,
+                "access_token": access_token,
+                "sign": calc_sign(payload, self._secret),
+                "t": timestamp,
+                "sign_method": "HMAC-SHA256",
+            }
+            try:
+                async with self._session.request(
+                    method,
+                    full_url,
+                    headers=dict(default_par, **headers),
+                    data=data,
+                    timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                ) as resp:
+                    if resp.status >= 500 and attempt < REQUEST_ATTEMPTS:
+                        _LOGGER.debug("Request %s failed, status %d", url, resp.status)
+                    else:
+                        try:
+                            r_json = await resp.json(content_type=None)
+                        except ValueError:
+                            r_json = None
+                        if (
+                            is_token_request
+                            or not isinstance(r_json, dict)
+                            or r_json.get("code") != ERR_TOKEN_INVALID
+                            or attempt == REQUEST_ATTEMPTS
+                        ):
+                            return CloudResponse(resp.status, r_json)
+                        token_revoked = True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                if attempt == REQUEST_ATTEMPTS:
+                    raise
+                _LOGGER.debug("Request %s failed: %s", url, ex)
 
-        resp = await self._hass.async_add_executor_job(func)
-        # r = json.dumps(r.json(), indent=2, ensure_ascii=False) # Beautify the format
-        return resp
+            if token_revoked:
+                # Token became invalid before it expired, get a new one
+                self._token_expires = 0
+                await self._async_ensure_token()
+            else:
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+
+    async def _async_ensure_token(self):
+        """Get a new access token if the current one is about to expire."""
+        if time.monotonic() < self._token_expires - TOKEN_REFRESH_MARGIN:
+            return
+        async with self._token_lock:
+            # Another request might have refreshed it in the meantime
+            if time.monotonic() < self._token_expires - TOKEN_REFRESH_MARGIN:
+                return
+            res = await self.async_get_access_token()
+            if res != "ok":
+                _LOGGER.warning("Failed to refresh cloud access token: %s", res)
 
     async def async_get_access_token(self):
         """Obtain a valid access token."""
         try:
             resp = await self.async_make_request("GET", "/v1.0/token?grant_type=1")
-        except requests.exceptions.ConnectionError:
+        except (aiohttp.ClientError, asyncio.TimeoutError):
             return "Request failed, status ConnectionError"
 
         if not resp.ok:
@@ -113,17 +203,19 @@ class TuyaCloudApi:
         if not r_json["success"]:
             return f"Error {r_json['code']}: {r_json['msg']}"
 
-        self._access_token = resp.json()["result"]["access_token"]
+        self._access_token = r_json["result"]["access_token"]
+        self._token_expires = time.monotonic() + r_json["result"]["expire_time"]
         return "ok"
 
-    async def async_get_devices_list(self):
-        """Obtain the list of devices associated to a user."""
-        resp = await self.async_make_request(
-            "GET", url=f"/v1.0/users/{self._user_id}/devices"
-        )
+    async def _async_get_result(self, url):
+        """Return the result of a GET request and an error message, if any."""
+        try:
+            resp = await self.async_make_request("GET", url=url)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None, "Request failed, status ConnectionError"
 
         if not resp.ok:
-            return "Request failed, status " + str(resp.status)
+            return None, "Request failed, status " + str(resp.status)
 
         r_json = resp.json()
         if not r_json["success"]:
@@ -131,9 +223,83 @@ class TuyaCloudApi:
             #     "Request failed, reply is %s",
             #     json.dumps(r_json, indent=2, ensure_ascii=False)
             # )
-            return f"Error {r_json['code']}: {r_json['msg']}"
+            return None, f"Error {r_json['code']}: {r_json['msg']}"
+        return r_json["result"], None
+
+    async def async_get_devices_list(self):
+        """Obtain the list of devices associated to a user, page by page."""
+        devices = {}
+        page_no = 1
+        while True:
+            page, error = await self._async_get_result(
+                f"/v1.0/users/{self._user_id}/devices"
+                f"?page_no={page_no}&page_size={DEVICE_PAGE_SIZE}"
+            )
+            if error is not None:
+                return error
+
+            new_devices = {dev["id"]: dev for dev in page if dev["id"] not in devices}
+            devices.update(new_devices)
+            # Stop at the last page, or if the whole list came back at once
+            if len(page) < DEVICE_PAGE_SIZE or not new_devices:
+                break
+            page_no += 1
 
-        self.device_list = {dev["id"]: dev for dev in r_json["result"]}
+        self.device_list = devices
+        now = time.monotonic()
+        self._fetched = dict.fromkeys(devices, now)
         # _LOGGER.debug("DEV_LIST: %s", self.device_list)
 
         return "ok"
+
+    async def async_get_device(self, dev_id):
+        """Obtain the details, including the local key, of a single device."""
+        device, error = await self._async_get_result(f"/v1.0/devices/{dev_id}")
+        if error is not None:
+            return error
+
+        self.device_list[dev_id] = {**self.device_list.get(dev_id, {}), **device}
+        self._fetched[dev_id] = time.monotonic()
+        return "ok"
+
+    async def async_get_local_key(self, dev_id):
+        """Return the current local key of a device, None if unknown.
+
+        Keys fetched less than DEVICE_CACHE_TTL seconds ago are returned right
+        away. Otherwise requests of all devices arriving within KEY_FETCH_WINDOW
+        are served by a single fetch: of the device alone if it is the only
+        one, else of the whole device list, as happens when a key rotation
+        makes many devices fail at once.
+        """
+        while not self._is_current(dev_id):
+            fetch = self._key_fetch
+            if fetch is None:
+                self._key_requests = set()
+                fetch = self._key_fetch = asyncio.create_task(self._async_fetch_keys())
+            if self._key_requests is None:
+                # Too late to join the running fetch, maybe it covers this device
+                await asyncio.shield(fetch)
+                continue
+            self._key_requests.add(dev_id)
+            await asyncio.shield(fetch)
+            break
+        return self.device_list.get(dev_id, {}).get("local_key")
+
+    def _is_current(self, dev_id):
+        """Return whether data of a device was fetched recently."""
+        fetched = self._fetched.get(dev_id)
+        return fetched is not None and time.monotonic() - fetched < DEVICE_CACHE_TTL
+
+    async def _async_fetch_keys(self):
+        """Fetch the devices requested during the collection window."""
+        try:
+            await asyncio.sleep(KEY_FETCH_WINDOW)
+            dev_ids, self._key_requests = self._key_requests, None
+            if len(dev_ids) == 1:
+                res = await self.async_get_device(next(iter(dev_ids)))
+            else:
+                res = await self.async_get_devices_list()
+            if res != "ok":
+                _LOGGER.warning("Failed to fetch local keys: %s", res)
+        finally:
+            self._key_fetch = None
@@ -0,0 +1,65 @@
+"""Encode and decode the colour DP of Tuya lights.
+
+Tuya lights use one of two encodings for colours:
+- 14 hex characters "rrggbbhhhhssvv" (RGB, then hue, saturation 0-255 and
+  value 0-255), used by older devices with brightness values up to 255;
+- 12 hex characters "hhhhssssvvvv" (hue, saturation 0-1000 and value 0-1000).
+
+Bulbs in music or scene mode push their colour several times a second and
+groups set many bulbs to the same colour, so both directions are cached.
+"""
+import colorsys
+from functools import lru_cache
+
+# Length of a colour in the HSV encoding
+HSV_ENCODED_LEN = 12
+
+# Distinct colours kept by the decode and encode caches
+COLOR_CACHE_SIZE = 256
+
+
+def is_rgb_encoded(color):
+    """Return whether a colour uses the RGB-hex+HSV encoding."""
+    return len(color) > HSV_ENCODED_LEN
+
+
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
+def decode_color(color):
+    """Return hue (0-360), saturation (0-100) and value of a colour.
+
+    The value is the raw brightness of the device. Returns None if the
+    colour cannot be parsed.
+    """
+    try:
+        if is_rgb_encoded(color):
+            hue = int(color[6:10], 16)
+            saturation = int(color[10:12], 16) * 100 / 255
+            value = int(color[12:14], 16)
+        elif len(color) == HSV_ENCODED_LEN:
+            hue = int(color[0:4], 16)
+            saturation = int(color[4:8], 16) / 10.0
+            value = int(color[8:12], 16)
+        else:
+            return None
+    except (TypeError, ValueError):
+        return None
+    return hue, saturation, value
+
+
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
+def encode_color(hue, saturation, brightness, upper_brightness, rgb_encoded):
+    """Return the colour DP value for a hue, saturation and raw brightness.
+
+    Hue is in degrees and saturation in percent like Home Assistant's hs
+    colours, upper_brightness is the raw brightness of a fully bright light.
+    """
+    if not rgb_encoded:
+        return f"{round(hue):04x}{round(saturation * 10.0):04x}{brightness:04x}"
+    # Same conversion as homeassistant.util.color.color_hsv_to_RGB
+    red, green, blue = colorsys.hsv_to_rgb(
+        hue / 360, saturation / 100, int(brightness * 100 / upper_brightness) / 100
+    )
+    return (
+        f"{int(red * 255):02x}{int(green * 255):02x}{int(blue * 255):02x}"
+        f"{round(hue):04x}{round(saturation * 255 / 100):02x}{brightness:02x}"
+    )
@@ -3,6 +3,7 @@ import asyncio
 import json.decoder
 import logging
 import time
+from collections import namedtuple
 from datetime import timedelta
 
 from homeassistant.const import (
@@ -15,13 +16,14 @@ from homeassistant.const import (
     CONF_PLATFORM,
     CONF_SCAN_INTERVAL,
     STATE_UNKNOWN,
+    Platform,
 )
 from homeassistant.core import callback
 from homeassistant.helpers.dispatcher import (
     async_dispatcher_connect,
     async_dispatcher_send,
 )
-from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
 from homeassistant.helpers.restore_state import RestoreEntity
 
 from . import pytuya
@@ -29,20 +31,41 @@ from .const import (
     ATTR_STATE,
     ATTR_UPDATED_AT,
     CONF_DEFAULT_VALUE,
+    CONF_DIAGNOSTIC_SENSORS,
     CONF_ENABLE_DEBUG,
     CONF_LOCAL_KEY,
     CONF_MODEL,
+    CONF_NO_CLOUD,
     CONF_PASSIVE_ENTITY,
+    CONF_PRODUCT_KEY,
     CONF_PROTOCOL_VERSION,
     CONF_RESET_DPIDS,
     CONF_RESTORE_ON_RECONNECT,
     DATA_CLOUD,
+    DATA_CONNECTION_MANAGER,
+    DATA_DEVICE_INDEX,
+    DATA_PROFILES,
     DOMAIN,
     TUYA_DEVICES,
 )
+from .profiles import (
+    PROFILE_DEV_TYPE,
+    PROFILE_DPS,
+    PROFILE_RESET_DPIDS,
+    PROFILE_UPDATE_DPS,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+IndexedDevice = namedtuple("IndexedDevice", "entry config entities")
+
+# Seconds to collect device config changes before writing the config entry
+CONFIG_PERSIST_DELAY = 10
+
+PENDING_DEVICE_UPDATES = "pending_device_updates"
+UNSUB_PERSIST = "unsub_persist"
+PERSISTED_DATA = "persisted_data"
+
 
 def prepare_setup_entities(hass, config_entry, platform):
     """Prepare ro setup entities for a platform."""
@@ -68,39 +91,38 @@ async def async_setup_entry(
     entity_class with functools.partial.
     """
     entities = []
+    device_index = hass.data[DOMAIN][DATA_DEVICE_INDEX]
+    dps_config_fields = list(get_dps_for_platform(flow_schema))
+
+    for dev_id, entities_to_setup in device_index.platform_entities(
+        config_entry, domain
+    ).items():
+        dev_entry = device_index.device_config(dev_id)
+        tuyainterface = hass.data[DOMAIN][TUYA_DEVICES][dev_id]
+        device_entities = []
+
+        for entity_config in entities_to_setup:
+            entity_dps = [entity_config[CONF_ID]]
+            # Add DPS used by this platform to the request list
+            for dp_conf in dps_config_fields:
+                if dp_conf in entity_config:
+                    tuyainterface.dps_to_request[entity_config[dp_conf]] = None
+                    entity_dps.append(entity_config[dp_conf])
+
+            # Only wake the entity up when one of its DPS changes
+            tuyainterface.subscribe(entity_config[CONF_ID], entity_dps)
+            device_entities.append(
+                entity_class(
+                    tuyainterface,
+                    dev_entry,
+                    entity_config[CONF_ID],
+                )
+            )
 
-    for dev_id in config_entry.data[CONF_DEVICES]:
-        # entities_to_setup = prepare_setup_entities(
-        #     hass, config_entry.data[dev_id], domain
-        # )
-        dev_entry = config_entry.data[CONF_DEVICES][dev_id]
-        entities_to_setup = [
-            entity
-            for entity in dev_entry[CONF_ENTITIES]
-            if entity[CONF_PLATFORM] == domain
-        ]
-
-        if entities_to_setup:
-
-            tuyainterface = hass.data[DOMAIN][TUYA_DEVICES][dev_id]
-
-            dps_config_fields = list(get_dps_for_platform(flow_schema))
-
-            for entity_config in entities_to_setup:
-                # Add DPS used by this platform to the request list
-                for dp_conf in dps_config_fields:
-                    if dp_conf in entity_config:
-                        tuyainterface.dps_to_request[entity_config[dp_conf]] = None
+        # Once the entities have been created, add to the TuyaDevice instance
+        tuyainterface.add_entities(device_entities)
+        entities.extend(device_entities)
 
-                entities.append(
-                    entity_class(
-                        tuyainterface,
-                        dev_entry,
-                        entity_config[CONF_ID],
-                    )
-                )
-    # Once the entities have been created, add to the TuyaDevice instance
-    tuyainterface.add_entities(entities)
     async_add_entities(entities)
 
 
@@ -111,24 +133,149 @@ def get_dps_for_platform(flow_schema):
             yield key.schema
 
 
-def get_entity_config(config_entry, dp_id):
-    """Return entity config for a given DPS id."""
-    for entity in config_entry[CONF_ENTITIES]:
-        if entity[CONF_ID] == dp_id:
-            return entity
-    raise Exception(f"missing entity config for id {dp_id}")
-
-
 @callback
 def async_config_entry_by_device_id(hass, device_id):
     """Look up config entry by device id."""
-    current_entries = hass.config_entries.async_entries(DOMAIN)
-    for entry in current_entries:
-        if device_id in entry.data.get(CONF_DEVICES, []):
-            return entry
-        else:
-            _LOGGER.warning(f"Missing device configuration for device_id {device_id}")
-    return None
+    entry = hass.data[DOMAIN][DATA_DEVICE_INDEX].entry(device_id)
+    if entry is None:
+        _LOGGER.debug("Missing device configuration for device_id %s", device_id)
+    return entry
+
+
+@callback
+def async_update_device_config(hass, entry, dev_id, updates):
+    """Persist changed settings of a device without reloading the entry.
+
+    Changes are collected for CONFIG_PERSIST_DELAY seconds and written with a
+    single config entry update, which the update listener does not reload for.
+    A running device applies the changes right away.
+    """
+    device = hass.data[DOMAIN][TUYA_DEVICES].get(dev_id)
+    if device is not None:
+        device.async_update_config(updates)
+    entry_data = hass.data[DOMAIN][entry.entry_id]
+    entry_data.setdefault(PENDING_DEVICE_UPDATES, {}).setdefault(dev_id, {}).update(
+        updates
+    )
+    if entry_data.get(UNSUB_PERSIST) is None:
+        entry_data[UNSUB_PERSIST] = async_call_later(
+            hass,
+            CONFIG_PERSIST_DELAY,
+            lambda _: async_persist_device_config(hass, entry),
+        )
+
+
+@callback
+def async_persist_device_config(hass, entry):
+    """Write pending device config changes to the config entry."""
+    entry_data = hass.data[DOMAIN][entry.entry_id]
+    unsub = entry_data.pop(UNSUB_PERSIST, None)
+    if unsub is not None:
+        unsub()
+    pending = entry_data.pop(PENDING_DEVICE_UPDATES, {})
+
+    # Copy every changed device, the current data may be shared with others
+    devices = dict(entry.data[CONF_DEVICES])
+    for dev_id, updates in pending.items():
+        if dev_id in devices:
+            devices[dev_id] = {**devices[dev_id], **updates}
+    if devices == entry.data[CONF_DEVICES]:
+        return
+
+    new_data = {
+        **entry.data,
+        CONF_DEVICES: devices,
+        ATTR_UPDATED_AT: str(int(time.time() * 1000)),
+    }
+    entry_data[PERSISTED_DATA] = new_data
+    hass.config_entries.async_update_entry(entry, data=new_data)
+
+
+@callback
+def async_is_persisted_device_config(hass, entry):
+    """Return whether the last entry update only persisted device changes."""
+    persisted = hass.data[DOMAIN][entry.entry_id].pop(PERSISTED_DATA, None)
+    return persisted is not None and persisted == dict(entry.data)
+
+
+class DeviceIndex:
+    """Index of configured devices by device id.
+
+    Holds the config entry, device config and entity configs by DP id of
+    every device, plus the entities of each entry by platform. An entry is
+    re-indexed whenever it is set up or updated, so lookups never scan the
+    config entries.
+    """
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self._devices = {}
+        self._entry_devices = {}
+        self._platforms = {}
+        self._diagnostic_devices = {}
+
+    @callback
+    def async_index_entry(self, entry):
+        """Add or refresh the devices of a config entry."""
+        devices = entry.data.get(CONF_DEVICES, {})
+        for dev_id in self._entry_devices.get(entry.entry_id, set()) - devices.keys():
+            del self._devices[dev_id]
+
+        platforms = {}
+        for dev_id, dev_config in devices.items():
+            entities = {}
+            for entity in dev_config[CONF_ENTITIES]:
+                entities[entity[CONF_ID]] = entity
+                platform = platforms.setdefault(entity[CONF_PLATFORM], {})
+                platform.setdefault(dev_id, []).append(entity)
+            self._devices[dev_id] = IndexedDevice(entry, dev_config, entities)
+
+        self._entry_devices[entry.entry_id] = set(devices)
+        self._platforms[entry.entry_id] = platforms
+        self._diagnostic_devices[entry.entry_id] = [
+            dev_id
+            for dev_id, dev_config in devices.items()
+            if dev_config.get(CONF_DIAGNOSTIC_SENSORS)
+        ]
+
+    @callback
+    def async_remove_entry(self, entry):
+        """Remove the devices of a config entry."""
+        for dev_id in self._entry_devices.pop(entry.entry_id, set()):
+            del self._devices[dev_id]
+        self._platforms.pop(entry.entry_id, None)
+        self._diagnostic_devices.pop(entry.entry_id, None)
+
+    def entry(self, dev_id):
+        """Return the config entry of a device, None if not configured."""
+        device = self._devices.get(dev_id)
+        return device.entry if device is not None else None
+
+    def device_config(self, dev_id):
+        """Return the config of a device."""
+        return self._devices[dev_id].config
+
+    def entity_config(self, dev_id, dp_id):
+        """Return entity config for a given DPS id."""
+        try:
+            return self._devices[dev_id].entities[dp_id]
+        except KeyError:
+            raise Exception(f"missing entity config for id {dp_id}") from None
+
+    def platforms(self, entry):
+        """Return the platforms used by the entities of a config entry."""
+        platforms = set(self._platforms.get(entry.entry_id, {}))
+        if self._diagnostic_devices.get(entry.entry_id):
+            platforms.add(Platform.SENSOR)
+        return platforms
+
+    def diagnostic_devices(self, entry):
+        """Return the ids of the devices of an entry with diagnostic sensors."""
+        return self._diagnostic_devices.get(entry.entry_id, [])
+
+    def platform_entities(self, entry, platform):
+        """Return the entity configs of a platform by device id."""
+        return self._platforms.get(entry.entry_id, {}).get(platform, {})
 
 
 class TuyaDevice(pytuya.TuyaListener, pytuya.ContextualLogger):
@@ -148,7 +295,21 @@ class TuyaDevice(pytuya.TuyaListener, pytuya.ContextualLogger):
         self._disconnect_task = None
         self._unsub_interval = None
         self._entities = []
+        self._subscribers = {}
+        self._connect_stats = pytuya.TimingStats()
+        self._key_recovery_stats = pytuya.TimingStats()
+        self._key_failed_at = None
+        # Statistics of all connections before the last one
+        self._command_totals = pytuya.TimingStats()
+        self._heartbeat_totals = pytuya.HeartbeatStats()
+        self._traffic_totals = pytuya.TrafficStats()
+        self._last_interface = None
+        self._disconnects = 0
         self._local_key = self._dev_config_entry[CONF_LOCAL_KEY]
+        self._write_lock = asyncio.Lock()
+        self._pending_dps = {}
+        self._pending_waiters = []
+        self._reconnect = False
         self._default_reset_dpids = None
         if CONF_RESET_DPIDS in self._dev_config_entry:
             reset_ids_str = self._dev_config_entry[CONF_RESET_DPIDS].split(",")
@@ -167,6 +328,18 @@ class TuyaDevice(pytuya.TuyaListener, pytuya.ContextualLogger):
         """Set the entities associated with this device."""
         self._entities.extend(entities)
 
+    def entity_config(self, dp_id):
+        """Return the config of an entity of this device."""
+        return self._hass.data[DOMAIN][DATA_DEVICE_INDEX].entity_config(
+            self._dev_config_entry[CONF_DEVICE_ID], dp_id
+        )
+
+    def subscribe(self, entity_dp, dps):
+        """Route status updates of DPS to the entity with id entity_dp."""
+        for dp_index in dps:
+            if dp_index is not None:
+                self._subscribers.setdefault(str(dp_index), set()).add(entity_dp)
+
     @property
     def is_connecting(self):
         """Return whether device is currently connecting."""
@@ -177,15 +350,99 @@ class TuyaDevice(pytuya.TuyaListener, pytuya.ContextualLogger):
         """Return if connected to device."""
         return self._interface is not None
 
-    def async_connect(self):
-        """Connect to device if not already connected."""
+    @property
+    def connection_stats(self):
+        """Return connection timing and traffic statistics.
+
+        Commands, heartbeats and traffic are counted over all connections
+        since the device was set up, session keys over the last connection.
+        """
+        commands = pytuya.TimingStats()
+        commands.merge(self._command_totals)
+        heartbeats = pytuya.HeartbeatStats()
+        heartbeats.merge(self._heartbeat_totals)
+        traffic = pytuya.TrafficStats()
+        traffic.merge(self._traffic_totals)
+        stats = {
+            CONF_PROTOCOL_VERSION: self._dev_config_entry[CONF_PROTOCOL_VERSION],
+            "connected": self.connected,
+            "connect": self._connect_stats.as_dict(),
+            "disconnects": self._disconnects,
+            "key_recovery": self._key_recovery_stats.as_dict(),
+        }
+        interface = self._last_interface
+        if interface is not None:
+            commands.merge(interface.command_stats)
+            heartbeats.merge(interface.heartbeat_stats)
+            traffic.merge(interface.traffic_stats)
+            stats["session_key"] = interface.session_key_stats.as_dict()
+        stats["command"] = commands.as_dict()
+        stats["heartbeat"] = heartbeats.as_dict()
+        stats["traffic"] = traffic.as_dict()
+        return stats
+
+    def _track_interface(self, interface):
+        """Keep the statistics of a new connection, adding up the previous."""
+        previous = self._last_interface
+        if previous is not None:
+            self._command_totals.merge(previous.command_stats)
+            self._heartbeat_totals.merge(previous.heartbeat_stats)
+            self._traffic_totals.merge(previous.traffic_stats)
+        self._last_interface = interface
+
+    def async_connect(self, priority=False):
+        """Connect to device if not already connected.
+
+        The attempt is queued in the connection manager, priority moves it to
+        the front of the queue and skips any pending backoff.
+        """
         # self.info("async_connect: %d %r %r", self._is_closing, self._connect_task, self._interface)
-        if not self._is_closing and self._connect_task is None and not self._interface:
-            self._connect_task = asyncio.create_task(self._make_connection())
+        if not self._is_closing and not self._interface:
+            manager = self._hass.data[DOMAIN].get(DATA_CONNECTION_MANAGER)
+            if manager is not None:
+                manager.request(self, priority)
+            else:
+                self.start_connection()
+
+    @callback
+    def async_update_config(self, updates):
+        """Apply changed settings, reconnecting only for a new address."""
+        updates = dict(updates)
+        host = updates.pop(CONF_HOST, None)
+        self._dev_config_entry.update(updates)
+        if CONF_LOCAL_KEY in updates:
+            self._local_key = updates[CONF_LOCAL_KEY]
+        if host is not None:
+            self.async_update_host(host)
+
+    @callback
+    def async_update_host(self, host):
+        """Move the device to a new address, reconnecting only this device."""
+        if host == self._dev_config_entry[CONF_HOST]:
+            return
+        self.info(
+            "Address changed from %s to %s", self._dev_config_entry[CONF_HOST], host
+        )
+        self._dev_config_entry[CONF_HOST] = host
+        if self._interface is not None:
+            # disconnected() connects to the new address
+            self._reconnect = True
+            self._hass.async_create_task(self._interface.close())
+        else:
+            self.async_connect(priority=True)
+
+    def start_connection(self):
+        """Start connecting right away, return the task or None if not needed."""
+        if self._is_closing or self._connect_task is not None or self._interface:
+            return None
+        self._connect_task = asyncio.create_task(self._make_connection())
+        return self._connect_task
 
     async def _make_connection(self):
         """Subscribe localtuya entity events."""
         self.info("Trying to connect to %s...", self._dev_config_entry[CONF_HOST])
+        start = time.monotonic()
+        retry = False
 
         try:
             self._interface = await pytuya.connect(
@@ -196,7 +453,9 @@ class TuyaDevice(pytuya.TuyaListener, pytuya.ContextualLogger):
                 self._dev_config_entry.get(CONF_ENABLE_DEBUG, False),
                 self,
             )
+            self._track_interface(self._interface)
             self._interface.add_dps_to_request(self.dps_to_request)
+            self._apply_profile()
         except Exception as ex:  # pylint: disable=broad-except
             self.warning(
                 f"Failed to connect to {self._dev_config_entry[CONF_HOST]}: %s", ex
@@ -210,28 +469,41 @@ class TuyaDevice(pytuya.TuyaListener, pytuya.ContextualLogger):
                 try:
                     self.debug("Retrieving initial state")
                     status = await self._interface.status()
-                    if status is None:
+                    if status is None or self._interface.traffic_stats.decode_errors:
                         raise Exception("Failed to retrieve status")
 
                     self._interface.start_heartbeat()
                     self.status_updated(status)
 
                 except Exception as ex:
-                    if (self._default_reset_dpids is not None) and (
-                        len(self._default_reset_dpids) > 0
+                    # Only payloads or session key replies that failed to
+                    # decrypt or verify hint at a wrong key, not timeouts
+                    if self._interface.traffic_stats.decode_errors or isinstance(
+                        ex,
+                        (
+                            pytuya.DecodeError,
+                            UnicodeDecodeError,
+                            json.decoder.JSONDecodeError,
+                        ),
                     ):
+                        raise pytuya.DecodeError(ex) from ex
+                    reset_dpids = self._default_reset_dpids or self._profile.get(
+                        PROFILE_RESET_DPIDS
+                    )
+                    if reset_dpids:
                         self.debug(
                             "Initial state update failed, trying reset command "
                             + "for DP IDs: %s",
-                            self._default_reset_dpids,
+                            reset_dpids,
                         )
-                        await self._interface.reset(self._default_reset_dpids)
+                        await self._interface.reset(reset_dpids)
 
                         self.debug("Update completed, retrying initial state")
                         status = await self._interface.status()
                         if status is None or not status:
                             raise Exception("Failed to retrieve status") from ex
 
+                        self._update_profile({PROFILE_RESET_DPIDS: reset_dpids})
                         self._interface.start_heartbeat()
                         self.status_updated(status)
                     else:
@@ -240,15 +512,31 @@ class TuyaDevice(pytuya.TuyaListener, pytuya.ContextualLogger):
                             await self._interface.close()
                             self._interface = None
 
-            except (UnicodeDecodeError, json.decoder.JSONDecodeError) as ex:
-                self.warning("Initial state update failed (%s), trying key update", ex)
-                await self.update_local_key()
+            except pytuya.DecodeError as ex:
+                self.warning(
+                    "Initial state update failed (%s), local_key may be wrong", ex
+                )
+                if self._key_failed_at is None:
+                    self._key_failed_at = start
+                # A new key gets a fresh protocol right after this attempt
+                retry = await self.update_local_key()
 
                 if self._interface is not None:
                     await self._interface.close()
                     self._interface = None
 
         if self._interface is not None:
+            # Time until the initial status, including 3.4 session key negotiation
+            self._connect_stats.add(time.monotonic() - start)
+            if self._key_failed_at is not None:
+                self._key_recovery_stats.add(time.monotonic() - self._key_failed_at)
+                self._key_failed_at = None
+                self.info(
+                    "Recovered from local_key change in %.1fs",
+                    self._key_recovery_stats.last,
+                )
+            self._update_profile({PROFILE_DEV_TYPE: self._interface.dev_type})
+
             # Attempt to restore status for all entities that need to first set
             # the DPS value before the device will respond with status.
             for entity in self._entities:
@@ -278,24 +566,63 @@ class TuyaDevice(pytuya.TuyaListener, pytuya.ContextualLogger):
                 )
 
             self.info(f"Successfully connected to {self._dev_config_entry[CONF_HOST]}")
+        else:
+            self._connect_stats.failures += 1
 
         self._connect_task = None
+        if retry:
+            self.async_connect(priority=True)
+
+    @property
+    def _profile(self):
+        """Return the profile of the model of this device."""
+        return self._hass.data[DOMAIN][DATA_PROFILES].get(
+            self._dev_config_entry.get(CONF_PRODUCT_KEY),
+            self._dev_config_entry[CONF_PROTOCOL_VERSION],
+        )
+
+    def _apply_profile(self):
+        """Skip detection and fallback round trips known for this model."""
+        profile = self._profile
+        if PROFILE_DEV_TYPE in profile:
+            self._interface.dev_type = profile[PROFILE_DEV_TYPE]
+        if PROFILE_DPS in profile:
+            self._interface.known_dps = profile[PROFILE_DPS]
+        if PROFILE_UPDATE_DPS in profile:
+            self._interface.update_dps_whitelist = profile[PROFILE_UPDATE_DPS]
+
+    def _update_profile(self, fields):
+        """Store what was learned about the model of this device."""
+        self._hass.data[DOMAIN][DATA_PROFILES].async_update(
+            self._dev_config_entry.get(CONF_PRODUCT_KEY),
+            self._dev_config_entry[CONF_PROTOCOL_VERSION],
+            fields,
+        )
 
     async def update_local_key(self):
-        """Retrieve updated local_key from Cloud API and update the config_entry."""
+        """Retrieve updated local_key from Cloud API, return whether it changed.
+
+        The new key is used from the next connection on and persisted without
+        reloading the config entry.
+        """
+        if self._config_entry.data.get(CONF_NO_CLOUD, True):
+            self.debug("Cloud API not configured, cannot retrieve local_key")
+            return False
         dev_id = self._dev_config_entry[CONF_DEVICE_ID]
-        await self._hass.data[DOMAIN][DATA_CLOUD].async_get_devices_list()
-        cloud_devs = self._hass.data[DOMAIN][DATA_CLOUD].device_list
-        if dev_id in cloud_devs:
-            self._local_key = cloud_devs[dev_id].get(CONF_LOCAL_KEY)
-            new_data = self._config_entry.data.copy()
-            new_data[CONF_DEVICES][dev_id][CONF_LOCAL_KEY] = self._local_key
-            new_data[ATTR_UPDATED_AT] = str(int(time.time() * 1000))
-            self._hass.config_entries.async_update_entry(
-                self._config_entry,
-                data=new_data,
-            )
-            self.info("local_key updated for device %s.", dev_id)
+        cloud_api = self._hass.data[DOMAIN][DATA_CLOUD]
+        try:
+            local_key = await cloud_api.async_get_local_key(dev_id)
+        except Exception as ex:  # pylint: disable=broad-except
+            self.warning("Failed to retrieve local_key from cloud: %s", ex)
+            return False
+        if local_key is None or local_key == self._local_key:
+            return False
+
+        async_update_device_config(
+            self._hass, self._config_entry, dev_id, {CONF_LOCAL_KEY: local_key}
+        )
+        self.info("local_key updated for device %s.", dev_id)
+        return True
 
     async def _async_refresh(self, _now):
         if self._interface is not None:
@@ -304,9 +631,16 @@ class TuyaDevice(pytuya.TuyaListener, pytuya.ContextualLogger):
     async def close(self):
         """Close connection and stop re-connect loop."""
         self._is_closing = True
+        self._abort_writes()
+        manager = self._hass.data[DOMAIN].get(DATA_CONNECTION_MANAGER)
+        if manager is not None:
+            manager.cancel(self)
         if self._connect_task is not None:
             self._connect_task.cancel()
-            await self._connect_task
+            try:
+                await self._connect_task
+            except asyncio.CancelledError:
+                pass
         if self._interface is not None:
             await self._interface.close()
         if self._disconnect_task is not None:
@@ -318,52 +652,158 @@ class TuyaDevice(pytuya.TuyaListener, pytuya.ContextualLogger):
 
     async def set_dp(self, state, dp_index):
         """Change value of a DP of the Tuya device."""
-        if self._interface is not None:
-            try:
-                await self._interface.set_dp(state, dp_index)
-            except Exception:  # pylint: disable=broad-except
-                self.exception("Failed to set DP %d to %s", dp_index, str(state))
-        else:
+        await self.set_dps({dp_index: state})
+
+    async def set_dps(self, states):
+        """Change value of a DPs of the Tuya device.
+
+        States are sent right away unless a write is waiting for its
+        acknowledgement, then all writes issued meanwhile are merged into the
+        next frame, the last value written to a DP wins. Returns once the
+        frame carrying these states has been acknowledged, so awaiting a
+        write before issuing the next keeps them in order in separate frames.
+        """
+        if self._interface is None:
             self.error(
                 "Not connected to device %s", self._dev_config_entry[CONF_FRIENDLY_NAME]
             )
+            return
 
-    async def set_dps(self, states):
-        """Change value of a DPs of the Tuya device."""
-        if self._interface is not None:
+        waiter = asyncio.get_running_loop().create_future()
+        self._pending_dps.update(
+            {str(dp_index): state for dp_index, state in states.items()}
+        )
+        self._pending_waiters.append(waiter)
+        if not self._write_lock.locked():
+            await self._flush_dps()
+        await waiter
+
+    async def send_dps(self, dps):
+        """Send DPs right away and return the seconds until acknowledged.
+
+        dps may have been serialized with pytuya.encode_dps(), so several
+        devices can share it. DP writes queued before are sent first. Raises
+        if the device is not connected or does not acknowledge the frame.
+        """
+        async with self._write_lock:
             try:
-                await self._interface.set_dps(states)
-            except Exception:  # pylint: disable=broad-except
-                self.exception("Failed to set DPs %r", states)
-        else:
+                await self._send_pending_dps()
+                interface = self._interface
+                if interface is None:
+                    raise ConnectionError("not connected to device")
+                start = time.monotonic()
+                await interface.set_dps(dps)
+            finally:
+                # Writes issued while waiting for the acknowledgement
+                self._hand_off_writes()
+            if self._interface is not interface:
+                raise ConnectionError("disconnected before acknowledgement")
+            return time.monotonic() - start
+
+    async def _flush_dps(self):
+        """Send queued DP writes until none are left."""
+        async with self._write_lock:
+            try:
+                await self._send_pending_dps()
+            finally:
+                self._hand_off_writes()
+
+    def _hand_off_writes(self):
+        """Let a new task send writes queued behind a failed or cancelled one.
+
+        Their callers are still waiting, and nothing else might write to the
+        device to flush them.
+        """
+        if self._pending_waiters:
+            self._hass.async_create_task(self._flush_dps())
+
+    async def _send_pending_dps(self):
+        """Send queued DP writes until none are left (lock must be held).
+
+        Writes queued while a frame is in flight go out together in the next.
+        """
+        while self._pending_waiters:
+            states, self._pending_dps = self._pending_dps, {}
+            waiters, self._pending_waiters = self._pending_waiters, []
+            try:
+                if states:
+                    await self._send_dps(states)
+            finally:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+
+    async def _send_dps(self, states):
+        if self._interface is None:
             self.error(
                 "Not connected to device %s", self._dev_config_entry[CONF_FRIENDLY_NAME]
             )
+            return
+        try:
+            await self._interface.set_dps(states)
+        except Exception:  # pylint: disable=broad-except
+            self.exception("Failed to set DPs %r", states)
+
+    def _abort_writes(self):
+        """Drop queued DP writes and release everyone waiting for them."""
+        if self._pending_dps:
+            self.warning("Dropping queued DP writes %r", self._pending_dps)
+        self._pending_dps = {}
+        waiters, self._pending_waiters = self._pending_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
 
     @callback
     def status_updated(self, status):
         """Device updated status."""
-        self._status.update(status)
-        self._dispatch_status()
+        changed = [
+            dp_index
+            for dp_index, value in status.items()
+            if dp_index not in self._status or self._status[dp_index] != value
+        ]
+        if not changed:
+            return
 
-    def _dispatch_status(self):
-        signal = f"localtuya_{self._dev_config_entry[CONF_DEVICE_ID]}"
-        async_dispatcher_send(self._hass, signal, self._status)
+        self._status.update(status)
+        entity_dps = set()
+        for dp_index in changed:
+            entity_dps.update(self._subscribers.get(str(dp_index), ()))
+        self._dispatch_status(entity_dps)
+
+    def _dispatch_status(self, entity_dps=None):
+        """Send status to the entities owning entity_dps (default: all)."""
+        if entity_dps is None:
+            entity_dps = {dp for dps in self._subscribers.values() for dp in dps}
+        dev_id = self._dev_config_entry[CONF_DEVICE_ID]
+        for entity_dp in entity_dps:
+            signal = f"localtuya_{dev_id}_{entity_dp}"
+            async_dispatcher_send(self._hass, signal, self._status)
 
     @callback
     def disconnected(self):
         """Device disconnected."""
-        signal = f"localtuya_{self._dev_config_entry[CONF_DEVICE_ID]}"
-        async_dispatcher_send(self._hass, signal, None)
+        # Entities see an empty status (unavailable) and everything counts as
+        # changed again after reconnecting
+        self._status = {}
+        self._dispatch_status()
         if self._unsub_interval is not None:
             self._unsub_interval()
             self._unsub_interval = None
+        if self._interface is not None:
+            self._disconnects += 1
         self._interface = None
+        self._abort_writes()
 
         if self._connect_task is not None:
             self._connect_task.cancel()
             self._connect_task = None
-        self.warning("Disconnected - waiting for discovery broadcast")
+
+        if self._reconnect:
+            self._reconnect = False
+            self.async_connect(priority=True)
+        else:
+            self.warning("Disconnected - waiting for discovery broadcast")
 
 
 class LocalTuyaEntity(RestoreEntity, pytuya.ContextualLogger):
@@ -374,7 +814,7 @@ class LocalTuyaEntity(RestoreEntity, pytuya.ContextualLogger):
         super().__init__()
         self._device = device
         self._dev_config_entry = config_entry
-        self._config = get_entity_config(config_entry, dp_id)
+        self._config = device.entity_config(dp_id)
         self._dp_id = dp_id
         self._status = {}
         self._state = None
@@ -404,18 +844,20 @@ class LocalTuyaEntity(RestoreEntity, pytuya.ContextualLogger):
             self.status_restored(state)
 
         def _update_handler(status):
-            """Update entity state when status was updated."""
+            """Update entity state when one of its DPS was updated."""
             if status is None:
                 status = {}
-            if self._status != status:
-                self._status = status.copy()
-                if status:
-                    self.status_updated()
+            # The device only notifies on changes and owns the dict
+            self._status = status
+            if status:
+                self.status_updated()
+                if not self._should_update_ha_state():
+                    return
 
-                # Update HA
-                self.schedule_update_ha_state()
+            # Update HA
+            self.schedule_update_ha_state()
 
-        signal = f"localtuya_{self._dev_config_entry[CONF_DEVICE_ID]}"
+        signal = f"localtuya_{self._dev_config_entry[CONF_DEVICE_ID]}_{self._dp_id}"
 
         self.async_on_remove(
             async_dispatcher_connect(self.hass, signal, _update_handler)
@@ -520,6 +962,13 @@ class LocalTuyaEntity(RestoreEntity, pytuya.ContextualLogger):
         if (state is not None) and (not self._device.is_connecting):
             self._last_state = state
 
+    def _should_update_ha_state(self):
+        """Return whether to write the state after a status update.
+
+        Called after status_updated(), override to hold back updates.
+        """
+        return True
+
     def status_restored(self, stored_state):
         """Device status was restored.
 
@@ -31,6 +31,7 @@ from .const import (
     ATTR_UPDATED_AT,
     CONF_ACTION,
     CONF_ADD_DEVICE,
+    CONF_DIAGNOSTIC_SENSORS,
     CONF_DPS_STRINGS,
     CONF_EDIT_DEVICE,
     CONF_ENABLE_DEBUG,
@@ -38,6 +39,7 @@ from .const import (
     CONF_MANUAL_DPS,
     CONF_MODEL,
     CONF_NO_CLOUD,
+    CONF_PRODUCT_KEY,
     CONF_PRODUCT_NAME,
     CONF_PROTOCOL_VERSION,
     CONF_RESET_DPIDS,
@@ -46,10 +48,17 @@ from .const import (
     CONF_ENABLE_ADD_ENTITIES,
     DATA_CLOUD,
     DATA_DISCOVERY,
+    DATA_PROFILES,
     DOMAIN,
     PLATFORMS,
 )
 from .discovery import discover
+from .profiles import (
+    PROFILE_DEV_TYPE,
+    PROFILE_DPS,
+    PROFILE_RESET_DPIDS,
+    PROFILE_UPDATE_DPS,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -98,6 +107,7 @@ DEVICE_SCHEMA = vol.Schema(
         vol.Optional(CONF_SCAN_INTERVAL): int,
         vol.Optional(CONF_MANUAL_DPS): cv.string,
         vol.Optional(CONF_RESET_DPIDS): str,
+        vol.Optional(CONF_DIAGNOSTIC_SENSORS, default=False): bool,
     }
 )
 
@@ -144,6 +154,7 @@ def options_schema(entities):
             vol.Optional(CONF_SCAN_INTERVAL): int,
             vol.Optional(CONF_MANUAL_DPS): cv.string,
             vol.Optional(CONF_RESET_DPIDS): cv.string,
+            vol.Optional(CONF_DIAGNOSTIC_SENSORS, default=False): bool,
             vol.Required(
                 CONF_ENTITIES, description={"suggested_value": entity_names}
             ): cv.multi_select(entity_names),
@@ -231,13 +242,20 @@ def config_schema():
     )
 
 
-async def validate_input(hass: core.HomeAssistant, data):
-    """Validate the user input allows us to connect."""
+async def validate_input(hass: core.HomeAssistant, data, product_key=None):
+    """Validate the user input allows us to connect.
+
+    What is learned about a device is stored in the profile of its model, so
+    further devices of the same model skip DPS probing and fallbacks.
+    """
     detected_dps = {}
+    profiles = hass.data[DOMAIN][DATA_PROFILES]
+    profile = profiles.get(product_key, data[CONF_PROTOCOL_VERSION])
 
     interface = None
 
     reset_ids = None
+    reset_used = False
     try:
         interface = await pytuya.connect(
             data[CONF_HOST],
@@ -246,6 +264,8 @@ async def validate_input(hass: core.HomeAssistant, data):
             float(data[CONF_PROTOCOL_VERSION]),
             data[CONF_ENABLE_DEBUG],
         )
+        if PROFILE_DEV_TYPE in profile:
+            interface.dev_type = profile[PROFILE_DEV_TYPE]
         if CONF_RESET_DPIDS in data:
             reset_ids_str = data[CONF_RESET_DPIDS].split(",")
             reset_ids = []
@@ -256,8 +276,12 @@ async def validate_input(hass: core.HomeAssistant, data):
                 data[CONF_RESET_DPIDS],
                 reset_ids,
             )
+        else:
+            reset_ids = profile.get(PROFILE_RESET_DPIDS)
         try:
-            detected_dps = await interface.detect_available_dps()
+            detected_dps = await interface.detect_available_dps(
+                profile.get(PROFILE_DPS)
+            )
         except Exception as ex:
             try:
                 _LOGGER.debug(
@@ -265,13 +289,29 @@ async def validate_input(hass: core.HomeAssistant, data):
                 )
                 if len(reset_ids) > 0:
                     await interface.reset(reset_ids)
-                    detected_dps = await interface.detect_available_dps()
+                    reset_used = True
+                    detected_dps = await interface.detect_available_dps(
+                        profile.get(PROFILE_DPS)
+                    )
             except Exception as ex:
                 _LOGGER.debug("No DPS able to be detected: %s", ex)
                 detected_dps = {}
 
         # if manual DPs are set, merge these.
         _LOGGER.debug("Detected DPS: %s", detected_dps)
+        if detected_dps:
+            learned = {
+                PROFILE_DPS: list(detected_dps),
+                PROFILE_DEV_TYPE: interface.dev_type,
+                PROFILE_UPDATE_DPS: [
+                    dp
+                    for dp in interface.update_dps_whitelist
+                    if str(dp) in detected_dps
+                ],
+            }
+            if reset_used:
+                learned[PROFILE_RESET_DPIDS] = reset_ids
+            profiles.async_update(product_key, data[CONF_PROTOCOL_VERSION], learned)
         if CONF_MANUAL_DPS in data:
             manual_dps_list = [dps.strip() for dps in data[CONF_MANUAL_DPS].split(",")]
             _LOGGER.debug(
@@ -592,7 +632,16 @@ class LocalTuyaOptionsFlowHandler(config_entries.OptionsFlow):
                         ]
                         return await self.async_step_configure_entity()
 
-                self.dps_strings = await validate_input(self.hass, user_input)
+                product_key = None
+                if self.editing_device:
+                    product_key = self.config_entry.data[CONF_DEVICES][dev_id].get(
+                        CONF_PRODUCT_KEY
+                    )
+                elif dev_id is not None:
+                    product_key = self.discovered_devices[dev_id].get("productKey")
+                self.dps_strings = await validate_input(
+                    self.hass, user_input, product_key
+                )
                 return await self.async_step_pick_entity_type()
             except CannotConnect:
                 errors["base"] = "cannot_connect"
@@ -0,0 +1,183 @@
+"""Bounded-concurrency connection handling for Tuya devices."""
+import logging
+import random
+import time
+from collections import deque
+
+from homeassistant.core import callback
+
+_LOGGER = logging.getLogger(__name__)
+
+# Connection attempts running at the same time, over all devices
+MAX_CONCURRENT_CONNECTS = 8
+
+# Retry delays after failed attempts: BACKOFF_BASE * 2^(failures - 1), capped
+BACKOFF_BASE = 5
+BACKOFF_MAX = 300
+
+
+class ConnectionManager:
+    """Ramp up device connections without flooding the network.
+
+    At most MAX_CONCURRENT_CONNECTS connection attempts run at once, failing
+    devices are retried with exponential backoff and jitter, and devices just
+    re-announced by discovery jump the queue and skip their backoff.
+    """
+
+    def __init__(self, hass, max_concurrent=MAX_CONCURRENT_CONNECTS):
+        """Initialize an idle manager."""
+        self._hass = hass
+        self._max_concurrent = max_concurrent
+        self._queue = deque()
+        self._connecting = set()
+        self._failures = {}
+        self._retries = {}
+        self._pending = set()
+        self._expedited = set()
+        self._ramp_waiting = set()
+        self._ramp_started = None
+        self.attempts = 0
+        self.failed_attempts = 0
+        self.last_ramp_duration = None
+        self.last_ramp_devices = 0
+        self.last_ramp_failed = 0
+
+    @callback
+    def request(self, device, priority=False):
+        """Queue a connection attempt for a device."""
+        if device in self._connecting:
+            if priority:
+                # Retry right away should the running attempt fail
+                self._expedited.add(device)
+            return
+        if device in self._retries:
+            if not priority:
+                return
+            self._retries.pop(device).cancel()
+
+        if device not in self._pending:
+            if not self._ramp_waiting:
+                self._ramp_started = time.monotonic()
+                self.last_ramp_devices = 0
+                self.last_ramp_failed = 0
+            self._pending.add(device)
+            self._ramp_waiting.add(device)
+            self.last_ramp_devices += 1
+
+        if device in self._queue:
+            if not priority:
+                return
+            self._queue.remove(device)
+        if priority:
+            self._queue.appendleft(device)
+        else:
+            self._queue.append(device)
+        self._pump()
+
+    @callback
+    def cancel(self, device):
+        """Forget a device, e.g. because it is being closed."""
+        if device in self._queue:
+            self._queue.remove(device)
+        retry = self._retries.pop(device, None)
+        if retry is not None:
+            retry.cancel()
+        self._connecting.discard(device)
+        self._failures.pop(device, None)
+        self._pending.discard(device)
+        self._expedited.discard(device)
+        self._ramp_waiting.discard(device)
+        self._check_ramp_done()
+
+    def as_dict(self):
+        """Return connection statistics."""
+        return {
+            "queued": len(self._queue),
+            "connecting": len(self._connecting),
+            "backing_off": len(self._retries),
+            "attempts": self.attempts,
+            "failed_attempts": self.failed_attempts,
+            "last_ramp_devices": self.last_ramp_devices,
+            "last_ramp_duration": self.last_ramp_duration,
+            "last_ramp_failed": self.last_ramp_failed,
+        }
+
+    def _pump(self):
+        """Start queued connection attempts while below the limit."""
+        while self._queue and len(self._connecting) < self._max_concurrent:
+            device = self._queue.popleft()
+            task = device.start_connection()
+            if task is None:
+                # Connected, connecting or closed in the meantime
+                self._done(device)
+                continue
+            self.attempts += 1
+            self._connecting.add(device)
+            task.add_done_callback(lambda _, device=device: self._finished(device))
+
+    @callback
+    def _finished(self, device):
+        """Handle the end of a connection attempt."""
+        self._connecting.discard(device)
+        expedited = device in self._expedited
+        self._expedited.discard(device)
+        if device.connected or device not in self._pending:
+            self._done(device)
+        elif expedited:
+            self.failed_attempts += 1
+            self._ramp_failed(device)
+            self._queue.appendleft(device)
+        else:
+            self.failed_attempts += 1
+            self._ramp_failed(device)
+            failures = self._failures.get(device, 0) + 1
+            self._failures[device] = failures
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (failures - 1))
+            delay *= random.uniform(0.5, 1.0)
+            _LOGGER.debug(
+                "Connection attempt %d failed, retrying in %.1fs", failures, delay
+            )
+            self._retries[device] = self._hass.loop.call_later(
+                delay, self._retry, device
+            )
+        self._pump()
+
+    @callback
+    def _retry(self, device):
+        """Queue a device again once its backoff has expired."""
+        self._retries.pop(device, None)
+        if device in self._pending:
+            self.request(device)
+
+    def _done(self, device):
+        """Stop tracking a device which does not need to connect anymore."""
+        self._failures.pop(device, None)
+        self._pending.discard(device)
+        self._ramp_waiting.discard(device)
+        self._check_ramp_done()
+
+    def _ramp_failed(self, device):
+        """Count a device of the current ramp whose first attempt failed."""
+        if device in self._ramp_waiting:
+            self._ramp_waiting.discard(device)
+            self.last_ramp_failed += 1
+            self._check_ramp_done()
+
+    def _check_ramp_done(self):
+        """Record how long it took until every device connected or failed once.
+
+        Devices which are offline for good keep retrying in the background
+        without holding up the ramp.
+        """
+        if self._ramp_waiting or self._ramp_started is None:
+            return
+        self.last_ramp_duration = time.monotonic() - self._ramp_started
+        self._ramp_started = None
+        _LOGGER.info(
+            "Tried %d devices in %.1fs, %d failed (%d attempts, %d failed in total)",
+            self.last_ramp_devices,
+            self.last_ramp_duration,
+            self.last_ramp_failed,
+            self.attempts,
+            self.failed_attempts,
+        )
@@ -4,6 +4,10 @@ DOMAIN = "localtuya"
 
 DATA_DISCOVERY = "discovery"
 DATA_CLOUD = "cloud_data"
+DATA_CONNECTION_MANAGER = "connection_manager"
+DATA_DEVICE_INDEX = "device_index"
+DATA_PROFILES = "profiles"
+DATA_SCENES = "scenes"
 
 # Platforms in this list must support config flows
 PLATFORMS = [
@@ -47,6 +51,7 @@ CONF_MANUAL_DPS = "manual_dps_strings"
 CONF_DEFAULT_VALUE = "dps_default_value"
 CONF_RESET_DPIDS = "reset_dpids"
 CONF_PASSIVE_ENTITY = "is_passive_entity"
+CONF_DIAGNOSTIC_SENSORS = "diagnostic_sensors"
 
 # light
 CONF_BRIGHTNESS_LOWER = "brightness_lower"
@@ -84,6 +89,11 @@ CONF_FAN_DPS_TYPE = "fan_dps_type"
 
 # sensor
 CONF_SCALING = "scaling"
+CONF_DEADBAND = "deadband"
+CONF_DEADBAND_PERCENT = "deadband_percent"
+CONF_MIN_INTERVAL = "min_interval"
+CONF_MAX_SILENCE = "max_silence"
+CONF_AGGREGATION = "aggregation"
 
 # climate
 CONF_TARGET_TEMPERATURE_DP = "target_temperature_dp"
@@ -1,7 +1,7 @@
 """Platform to locally control Tuya-based cover devices."""
-import asyncio
 import logging
 import time
+import weakref
 from functools import partial
 
 import voluptuous as vol
@@ -10,6 +10,7 @@ from homeassistant.components.cover import (
     DOMAIN,
     CoverEntity, CoverEntityFeature,
 )
+from homeassistant.core import callback
 
 from .common import LocalTuyaEntity, async_setup_entry
 from .const import (
@@ -36,6 +37,9 @@ DEFAULT_COMMANDS_SET = COVER_ONOFF_CMDS
 DEFAULT_POSITIONING_MODE = COVER_MODE_NONE
 DEFAULT_SPAN_TIME = 25.0
 
+# Seconds between the positions published while timed covers move
+POSITION_PUBLISH_INTERVAL = 1.0
+
 
 def flow_schema(dps):
     """Return schema used in config flow."""
@@ -55,6 +59,102 @@ def flow_schema(dps):
     }
 
 
+class TimedPosition:
+    """Position of a cover estimated from how long it has been moving.
+
+    Times come from time.monotonic(), so clock changes do not move covers.
+    """
+
+    def __init__(self, span_time, position=0):
+        """Initialize a stopped cover."""
+        self.span_time = span_time
+        self._position = position
+        self._direction = 0
+        self._started = None
+
+    @property
+    def moving(self):
+        """Return whether the cover is moving."""
+        return self._direction != 0
+
+    def position(self, now=None):
+        """Return the estimated position from 0 to 100 at a time, default now."""
+        if not self._direction:
+            return self._position
+        if now is None:
+            now = time.monotonic()
+        moved = (now - self._started) / self.span_time * 100.0
+        return min(100.0, max(0.0, self._position + moved * self._direction))
+
+    def start(self, direction, now=None):
+        """Start moving up (direction 1) or down (direction -1)."""
+        if now is None:
+            now = time.monotonic()
+        self._position = self.position(now)
+        self._direction = direction
+        self._started = now
+
+    def stop(self, now=None):
+        """Stop moving, return the position reached."""
+        self._position = self.position(now)
+        self._direction = 0
+        return self._position
+
+    def set(self, position):
+        """Set the position of a stopped cover, e.g. when restoring it."""
+        self._position = min(100.0, max(0.0, float(position)))
+
+    def travel_time(self, target):
+        """Return the seconds needed to move to a position."""
+        return abs(target - self.position()) / 100.0 * self.span_time
+
+
+class PositionTicker:
+    """Single timer publishing the positions of all moving timed covers.
+
+    Covers moving together share one timer instead of each updating their
+    state on its own.
+    """
+
+    def __init__(self, loop):
+        """Initialize a ticker without covers."""
+        self._loop = loop
+        self._covers = set()
+        self._timer = None
+
+    def add(self, cover):
+        """Publish the position of a cover until it is discarded."""
+        self._covers.add(cover)
+        if self._timer is None:
+            self._timer = self._loop.call_later(POSITION_PUBLISH_INTERVAL, self._tick)
+
+    def discard(self, cover):
+        """Stop publishing the position of a cover."""
+        self._covers.discard(cover)
+        if not self._covers and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _tick(self):
+        self._timer = None
+        for cover in list(self._covers):
+            if not cover.async_publish_position():
+                self._covers.discard(cover)
+        if self._covers:
+            self._timer = self._loop.call_later(POSITION_PUBLISH_INTERVAL, self._tick)
+
+
+_POSITION_TICKERS = weakref.WeakKeyDictionary()
+
+
+def position_ticker(loop):
+    """Return the position ticker shared by all covers on a loop."""
+    ticker = _POSITION_TICKERS.get(loop)
+    if ticker is None:
+        ticker = _POSITION_TICKERS[loop] = PositionTicker(loop)
+    return ticker
+
+
 class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
     """Tuya cover device."""
 
@@ -67,10 +167,12 @@ class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
         self._open_cmd = commands_set.split("_")[0]
         self._close_cmd = commands_set.split("_")[1]
         self._stop_cmd = commands_set.split("_")[2]
-        self._timer_start = time.time()
         self._state = self._stop_cmd
         self._previous_state = self._state
         self._current_cover_position = 0
+        self._timed_position = TimedPosition(self._config[CONF_SPAN_TIME])
+        self._stop_timer = None
+        self._stop_for = None
         _LOGGER.debug("Initialized cover [%s]", self.name)
 
     @property
@@ -86,6 +188,8 @@ class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
         """Return current cover position in percent."""
         if self._config[CONF_POSITIONING_MODE] == COVER_MODE_NONE:
             return None
+        if self._config[CONF_POSITIONING_MODE] == COVER_MODE_TIMED:
+            return round(self._timed_position.position())
         return self._current_cover_position
 
     @property
@@ -106,11 +210,7 @@ class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
         if self._config[CONF_POSITIONING_MODE] == COVER_MODE_NONE:
             return False
 
-        if self._current_cover_position == 0:
-            return True
-        if self._current_cover_position == 100:
-            return False
-        return False
+        return self.current_cover_position == 0
 
     async def async_set_cover_position(self, **kwargs):
         """Move the cover to a specific position."""
@@ -118,16 +218,23 @@ class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
         if self._config[CONF_POSITIONING_MODE] == COVER_MODE_TIMED:
             newpos = float(kwargs[ATTR_POSITION])
 
-            currpos = self.current_cover_position
-            posdiff = abs(newpos - currpos)
-            mydelay = posdiff / 100.0 * self._config[CONF_SPAN_TIME]
+            currpos = self._timed_position.position()
+            mydelay = self._timed_position.travel_time(newpos)
+            if newpos in (0, 100):
+                # Make sure the cover reaches its end position
+                mydelay += COVER_TIMEOUT_TOLERANCE
             if newpos > currpos:
                 self.debug("Opening to %f: delay %f", newpos, mydelay)
                 await self.async_open_cover()
-            else:
+                command = self._open_cmd
+            elif newpos < currpos:
                 self.debug("Closing to %f: delay %f", newpos, mydelay)
                 await self.async_close_cover()
-            self.hass.async_create_task(self.async_stop_after_timeout(mydelay))
+                command = self._close_cmd
+            else:
+                return
+            # Replaces the stop after a full span scheduled by open/close
+            self._schedule_stop(mydelay, command)
             self.debug("Done")
 
         elif self._config[CONF_POSITIONING_MODE] == COVER_MODE_POSITION:
@@ -140,10 +247,25 @@ class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
                     converted_position, self._config[CONF_SET_POSITION_DP]
                 )
 
-    async def async_stop_after_timeout(self, delay_sec):
-        """Stop the cover if timeout (max movement span) occurred."""
-        await asyncio.sleep(delay_sec)
-        await self.async_stop_cover()
+    def _schedule_stop(self, delay_sec, command):
+        """Stop the cover moving with command after a delay.
+
+        Replaces any stop scheduled before.
+        """
+        self._cancel_stop()
+        self._stop_for = command
+        self._stop_timer = self.hass.loop.call_later(delay_sec, self._stop_timeout)
+
+    def _cancel_stop(self):
+        if self._stop_timer is not None:
+            self._stop_timer.cancel()
+            self._stop_timer = None
+
+    @callback
+    def _stop_timeout(self):
+        """Stop the cover once it should have reached its position."""
+        self._stop_timer = None
+        self.hass.async_create_task(self.async_stop_cover())
 
     async def async_open_cover(self, **kwargs):
         """Open the cover."""
@@ -152,10 +274,8 @@ class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
         if self._config[CONF_POSITIONING_MODE] == COVER_MODE_TIMED:
             # for timed positioning, stop the cover after a full opening timespan
             # instead of waiting the internal timeout
-            self.hass.async_create_task(
-                self.async_stop_after_timeout(
-                    self._config[CONF_SPAN_TIME] + COVER_TIMEOUT_TOLERANCE
-                )
+            self._schedule_stop(
+                self._config[CONF_SPAN_TIME] + COVER_TIMEOUT_TOLERANCE, self._open_cmd
             )
 
     async def async_close_cover(self, **kwargs):
@@ -165,24 +285,36 @@ class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
         if self._config[CONF_POSITIONING_MODE] == COVER_MODE_TIMED:
             # for timed positioning, stop the cover after a full opening timespan
             # instead of waiting the internal timeout
-            self.hass.async_create_task(
-                self.async_stop_after_timeout(
-                    self._config[CONF_SPAN_TIME] + COVER_TIMEOUT_TOLERANCE
-                )
+            self._schedule_stop(
+                self._config[CONF_SPAN_TIME] + COVER_TIMEOUT_TOLERANCE, self._close_cmd
             )
 
     async def async_stop_cover(self, **kwargs):
         """Stop the cover."""
         self.debug("Launching command %s to cover ", self._stop_cmd)
+        self._cancel_stop()
         await self._device.set_dp(self._stop_cmd, self._dp_id)
 
+    @callback
+    def async_publish_position(self):
+        """Publish the estimated position, return whether to keep doing so."""
+        self.async_write_ha_state()
+        position = self._timed_position.position()
+        return self._timed_position.moving and 0 < position < 100
+
+    async def async_will_remove_from_hass(self):
+        """Cancel scheduled stops and position updates."""
+        self._cancel_stop()
+        position_ticker(self.hass.loop).discard(self)
+        await super().async_will_remove_from_hass()
+
     def status_restored(self, stored_state):
         """Restore the last stored cover status."""
         if self._config[CONF_POSITIONING_MODE] == COVER_MODE_TIMED:
             stored_pos = stored_state.attributes.get("current_position")
             if stored_pos is not None:
-                self._current_cover_position = stored_pos
-                self.debug("Restored cover position %s", self._current_cover_position)
+                self._timed_position.set(stored_pos)
+                self.debug("Restored cover position %s", stored_pos)
 
     def status_updated(self):
         """Device status was updated."""
@@ -203,26 +335,26 @@ class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
             self._config[CONF_POSITIONING_MODE] == COVER_MODE_TIMED
             and self._state != self._previous_state
         ):
-            if self._previous_state != self._stop_cmd:
+            now = time.monotonic()
+            ticker = position_ticker(self.hass.loop)
+            if self._stop_timer is not None and self._state != self._stop_for:
+                # Stopped or reversed on the device, e.g. with a wall switch
+                self.debug("Cancelling stop scheduled for %s", self._stop_for)
+                self._cancel_stop()
+            if self._timed_position.moving:
                 # the state has changed, and the cover was moving
-                time_diff = time.time() - self._timer_start
-                pos_diff = round(time_diff / self._config[CONF_SPAN_TIME] * 100.0)
-                if self._previous_state == self._close_cmd:
-                    pos_diff = -pos_diff
-                self._current_cover_position = min(
-                    100, max(0, self._current_cover_position + pos_diff)
-                )
-
+                position = self._timed_position.stop(now)
                 change = "stopped" if self._state == self._stop_cmd else "inverted"
-                self.debug(
-                    "Movement %s after %s sec., position difference %s",
-                    change,
-                    time_diff,
-                    pos_diff,
-                )
-
-            # store the time of the last movement change
-            self._timer_start = time.time()
+                self.debug("Movement %s at position %.1f", change, position)
+
+            if self._state == self._open_cmd:
+                self._timed_position.start(1, now)
+                ticker.add(self)
+            elif self._state == self._close_cmd:
+                self._timed_position.start(-1, now)
+                ticker.add(self)
+            else:
+                ticker.discard(self)
 
         # Keep record in last_state as long as not during connection/re-connection,
         # as last state will be used to restore the previous state
@@ -7,6 +7,7 @@ https://github.com/ct-Open-Source/tuya-convert/blob/master/scripts/tuya-discover
 import asyncio
 import json
 import logging
+import time
 from hashlib import md5
 
 from cryptography.hazmat.backends import default_backend
@@ -18,6 +19,9 @@ UDP_KEY = md5(b"yGAdlopoPVldABfn").digest()
 
 DEFAULT_TIMEOUT = 6.0
 
+# Seconds after which a device that stopped broadcasting is forgotten
+DISCOVERY_TTL = 300
+
 
 def decrypt_udp(message):
     """Decrypt encrypted UDP broadcasts."""
@@ -30,14 +34,38 @@ def decrypt_udp(message):
     return _unpad(decryptor.update(message) + decryptor.finalize()).decode()
 
 
+class DiscoveryEntry:
+    """Last broadcast received from a device."""
+
+    __slots__ = ("digest", "key", "last_seen")
+
+    def __init__(self, digest, key, last_seen):
+        """Initialize a new DiscoveryEntry."""
+        self.digest = digest
+        self.key = key
+        self.last_seen = last_seen
+
+
 class TuyaDiscovery(asyncio.DatagramProtocol):
-    """Datagram handler listening for Tuya broadcast messages."""
+    """Datagram handler listening for Tuya broadcast messages.
 
-    def __init__(self, callback=None):
+    Devices rebroadcast the same datagram every few seconds, so datagrams are
+    indexed by hash and repeats are dropped before decrypting them. callback
+    is only called for new devices and when the (ip, productKey, version) of
+    a device changes, seen_callback with the device id for every other
+    broadcast.
+    """
+
+    def __init__(self, callback=None, seen_callback=None, ttl=DISCOVERY_TTL):
         """Initialize a new BaseDiscovery."""
         self.devices = {}
+        self._index = {}
+        self._hashes = {}
+        self._ttl = ttl
+        self._last_purge = time.monotonic()
         self._listeners = []
         self._callback = callback
+        self._seen_callback = seen_callback
 
     async def start(self):
         """Start discovery by listening to broadcasts."""
@@ -55,11 +83,25 @@ class TuyaDiscovery(asyncio.DatagramProtocol):
     def close(self):
         """Stop discovery."""
         self._callback = None
+        self._seen_callback = None
         for transport, _ in self._listeners:
             transport.close()
 
     def datagram_received(self, data, addr):
         """Handle received broadcast message."""
+        now = time.monotonic()
+        if now - self._last_purge > self._ttl:
+            self._purge(now)
+
+        digest = hash(data)
+        entry = self._index.get(self._hashes.get(digest))
+        if entry is not None and entry.digest == digest:
+            # Unchanged rebroadcast of a known device
+            entry.last_seen = now
+            if self._seen_callback:
+                self._seen_callback(self._hashes[digest])
+            return
+
         data = data[20:-8]
         try:
             data = decrypt_udp(data)
@@ -67,16 +109,47 @@ class TuyaDiscovery(asyncio.DatagramProtocol):
             data = data.decode()
 
         decoded = json.loads(data)
-        self.device_found(decoded)
+        self.device_found(decoded, digest, now)
 
-    def device_found(self, device):
+    def device_found(self, device, digest=None, now=None):
         """Discover a new device."""
-        if device.get("gwId") not in self.devices:
-            self.devices[device.get("gwId")] = device
-            _LOGGER.debug("Discovered device: %s", device)
+        gw_id = device.get("gwId")
+        key = (device.get("ip"), device.get("productKey"), device.get("version"))
+        entry = self._index.get(gw_id)
+        if entry is not None:
+            self._hashes.pop(entry.digest, None)
+        if digest is not None:
+            self._hashes[digest] = gw_id
+        self._index[gw_id] = DiscoveryEntry(
+            digest, key, time.monotonic() if now is None else now
+        )
+        self.devices[gw_id] = device
 
-        if self._callback:
-            self._callback(device)
+        if entry is None or entry.key != key:
+            _LOGGER.debug("Discovered device: %s", device)
+            if self._callback:
+                self._callback(device)
+        elif self._seen_callback:
+            self._seen_callback(gw_id)
+
+    def replay(self, gw_ids):
+        """Report devices still broadcasting to callback again.
+
+        Broadcasts received before a config entry was set up found no device
+        to update, and their repeats only reach seen_callback.
+        """
+        for gw_id in gw_ids:
+            if gw_id in self._index and self._callback:
+                self._callback(self.devices[gw_id])
+
+    def _purge(self, now):
+        """Forget devices which have not broadcast within the TTL."""
+        self._last_purge = now
+        for gw_id, entry in list(self._index.items()):
+            if now - entry.last_seen > self._ttl:
+                _LOGGER.debug("Device %s stopped broadcasting", gw_id)
+                del self._index[gw_id]
+                self._hashes.pop(entry.digest, None)
 
 
 async def discover():
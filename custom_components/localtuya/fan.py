@@ -114,10 +114,10 @@ class LocaltuyaFan(LocalTuyaEntity, FanEntity):
     ) -> None:
         """Turn on the entity."""
         _LOGGER.debug("Fan async_turn_on")
-        await self._device.set_dp(True, self._dp_id)
         if percentage is not None:
             await self.async_set_percentage(percentage)
         else:
+            await self._device.set_dp(True, self._dp_id)
             self.schedule_update_ha_state()
 
     async def async_turn_off(self, **kwargs) -> None:
@@ -127,6 +127,19 @@ class LocaltuyaFan(LocalTuyaEntity, FanEntity):
         await self._device.set_dp(False, self._dp_id)
         self.schedule_update_ha_state()
 
+    def _speed_value(self, percentage):
+        """Return the speed DP value for a percentage."""
+        if self._use_ordered_list:
+            value = self._dps_type(
+                percentage_to_ordered_list_item(self._ordered_list, percentage)
+            )
+        else:
+            value = self._dps_type(
+                math.ceil(percentage_to_ranged_value(self._speed_range, percentage))
+            )
+        _LOGGER.debug("Fan async_set_percentage: %s > %s", percentage, value)
+        return value
+
     async def async_set_percentage(self, percentage):
         """Set the speed of the fan."""
         _LOGGER.debug("Fan async_set_percentage: %s", percentage)
@@ -134,35 +147,13 @@ class LocaltuyaFan(LocalTuyaEntity, FanEntity):
         if percentage is not None:
             if percentage == 0:
                 return await self.async_turn_off()
+            states = {
+                self._config.get(CONF_FAN_SPEED_CONTROL): self._speed_value(percentage)
+            }
             if not self.is_on:
-                await self.async_turn_on()
-            if self._use_ordered_list:
-                await self._device.set_dp(
-                    self._dps_type(
-                        percentage_to_ordered_list_item(self._ordered_list, percentage)
-                    ),
-                    self._config.get(CONF_FAN_SPEED_CONTROL),
-                )
-                _LOGGER.debug(
-                    "Fan async_set_percentage: %s > %s",
-                    percentage,
-                    percentage_to_ordered_list_item(self._ordered_list, percentage),
-                )
-
-            else:
-                await self._device.set_dp(
-                    self._dps_type(
-                        math.ceil(
-                            percentage_to_ranged_value(self._speed_range, percentage)
-                        )
-                    ),
-                    self._config.get(CONF_FAN_SPEED_CONTROL),
-                )
-                _LOGGER.debug(
-                    "Fan async_set_percentage: %s > %s",
-                    percentage,
-                    percentage_to_ranged_value(self._speed_range, percentage),
-                )
+                # Power and speed go out in a single frame
+                states[self._dp_id] = True
+            await self._device.set_dps(states)
             self.schedule_update_ha_state()
 
     async def async_oscillate(self, oscillating: bool) -> None:
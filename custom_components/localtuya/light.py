@@ -1,7 +1,6 @@
 """Platform to locally control Tuya-based light devices."""
 import logging
-import textwrap
-from functools import partial
+from functools import lru_cache, partial
 
 import homeassistant.util.color as color_util
 import voluptuous as vol
@@ -17,9 +16,14 @@ from homeassistant.components.light import (
     SUPPORT_EFFECT,
     LightEntity,
 )
-from homeassistant.const import CONF_BRIGHTNESS, CONF_COLOR_TEMP, CONF_SCENE
-
-from .common import LocalTuyaEntity, async_setup_entry
+from homeassistant.const import CONF_BRIGHTNESS, CONF_COLOR_TEMP, CONF_NAME, CONF_SCENE
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers import entity_platform
+
+from .color_codec import decode_color, encode_color, is_rgb_encoded
+from .common import LocalTuyaEntity
+from .common import async_setup_entry as async_setup_platform
 from .const import (
     CONF_BRIGHTNESS_LOWER,
     CONF_BRIGHTNESS_UPPER,
@@ -29,7 +33,9 @@ from .const import (
     CONF_COLOR_TEMP_MIN_KELVIN,
     CONF_COLOR_TEMP_REVERSE,
     CONF_MUSIC_MODE,
+    DATA_SCENES,
 )
+from .const import DOMAIN as LOCALTUYA_DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -49,6 +55,9 @@ MODE_WHITE = "white"
 SCENE_CUSTOM = "Custom"
 SCENE_MUSIC = "Music"
 
+SERVICE_CAPTURE_SCENE = "capture_scene"
+SERVICE_DELETE_SCENE = "delete_scene"
+
 SCENE_LIST_RGBW_1000 = {
     "Night": "000e0d0000000000000000c80000",
     "Read": "010e0d0000000000000003e801f4",
@@ -91,6 +100,68 @@ SCENE_LIST_RGB_1000 = {
     + "0000000",
 }
 
+# Built-in scene lists, the light model determines which one applies
+SCENE_LISTS = {
+    "rgbw_255": SCENE_LIST_RGBW_255,
+    "rgb_1000": SCENE_LIST_RGB_1000,
+    "rgbw_1000": SCENE_LIST_RGBW_1000,
+}
+
+
+@lru_cache(maxsize=None)
+def scene_index(scene_list):
+    """Return the names of the scenes of a built-in list by scene data.
+
+    Built once and shared by all lights using the list.
+    """
+    index = {}
+    for name, data in SCENE_LISTS[scene_list].items():
+        index.setdefault(data, name)
+    return index
+
+
+class SceneRegistry:
+    """Scenes of a light: a built-in scene list and scenes captured by users.
+
+    Captured scenes map DP ids to values and are replayed with a single
+    set_dps. They are found by the value of the scene DP, like built-in ones.
+    """
+
+    def __init__(self, scene_list=None, scene_dp=None):
+        """Initialize a registry without captured scenes."""
+        self._scenes = SCENE_LISTS[scene_list] if scene_list else {}
+        self._index = scene_index(scene_list) if scene_list else {}
+        self._scene_dp = str(scene_dp) if scene_dp is not None else None
+        self.captured = {}
+        self._captured_index = {}
+
+    def set_captured(self, captured):
+        """Replace the captured scenes."""
+        self.captured = captured
+        self._captured_index = {}
+        for name, dps in captured.items():
+            data = dps.get(self._scene_dp)
+            if data is not None:
+                self._captured_index.setdefault(data, name)
+
+    @property
+    def names(self):
+        """Return the names of all scenes."""
+        return list(self._scenes) + [
+            name for name in self.captured if name not in self._scenes
+        ]
+
+    def get(self, name):
+        """Return the data of a built-in scene, None if there is none."""
+        return self._scenes.get(name)
+
+    def find(self, data):
+        """Return the name of the scene with some scene data."""
+        name = self._captured_index.get(data)
+        if name is None:
+            name = self._index.get(data, SCENE_CUSTOM)
+        return name
+
 
 def map_range(value, from_lower, from_upper, to_lower, to_upper):
     """Map a value in one range to another."""
@@ -165,18 +236,66 @@ class LocaltuyaLight(LocalTuyaEntity, LightEntity):
         self._hs = None
         self._effect = None
         self._effect_list = []
-        self._scenes = None
+        scene_list = None
         if self.has_config(CONF_SCENE):
             if self._config.get(CONF_SCENE) < 20:
-                self._scenes = SCENE_LIST_RGBW_255
+                scene_list = "rgbw_255"
             elif self._config.get(CONF_BRIGHTNESS) is None:
-                self._scenes = SCENE_LIST_RGB_1000
+                scene_list = "rgb_1000"
             else:
-                self._scenes = SCENE_LIST_RGBW_1000
-            self._effect_list = list(self._scenes.keys())
+                scene_list = "rgbw_1000"
+        self._scenes = SceneRegistry(scene_list, self._config.get(CONF_SCENE))
+        self.__update_effect_list()
+
+    async def async_added_to_hass(self):
+        """Load the captured scenes, then subscribe localtuya events."""
+        store = self.hass.data[LOCALTUYA_DOMAIN][DATA_SCENES]
+        self._scenes.set_captured(store.get(self.unique_id))
+        self.__update_effect_list()
+        await super().async_added_to_hass()
+
+    def __update_effect_list(self):
+        self._effect_list = self._scenes.names
         if self._config.get(CONF_MUSIC_MODE):
             self._effect_list.append(SCENE_MUSIC)
 
+    def __current_scene_dps(self):
+        """Return the DPs describing the current state, for a captured scene."""
+        dps = {str(self._dp_id): True}
+        if self.is_white_mode:
+            confs = (CONF_COLOR_MODE, CONF_BRIGHTNESS, CONF_COLOR_TEMP)
+        elif self.is_color_mode:
+            confs = (CONF_COLOR_MODE, CONF_COLOR)
+        elif self.is_scene_mode:
+            confs = (CONF_COLOR_MODE, CONF_SCENE)
+        else:
+            confs = (CONF_COLOR_MODE,)
+        for conf in confs:
+            if self.has_config(conf) and self.dps_conf(conf) is not None:
+                dps[str(self._config[conf])] = self.dps_conf(conf)
+        return dps
+
+    async def async_capture_scene(self, name):
+        """Capture the current state as a scene."""
+        if name in (SCENE_CUSTOM, SCENE_MUSIC) or self._scenes.get(name):
+            raise HomeAssistantError(f"{name} is a built-in scene")
+        if not self._status:
+            raise HomeAssistantError("light state is unknown")
+        store = self.hass.data[LOCALTUYA_DOMAIN][DATA_SCENES]
+        store.async_capture(self.unique_id, name, self.__current_scene_dps())
+        self._scenes.set_captured(store.get(self.unique_id))
+        self.__update_effect_list()
+        self.async_write_ha_state()
+
+    async def async_delete_scene(self, name):
+        """Delete a captured scene."""
+        store = self.hass.data[LOCALTUYA_DOMAIN][DATA_SCENES]
+        if not store.async_delete(self.unique_id, name):
+            raise HomeAssistantError(f"no captured scene named {name}")
+        self._scenes.set_captured(store.get(self.unique_id))
+        self.__update_effect_list()
+        self.async_write_ha_state()
+
     @property
     def is_on(self):
         """Check if Tuya light is on."""
@@ -253,7 +372,11 @@ class LocaltuyaLight(LocalTuyaEntity, LightEntity):
             supports |= SUPPORT_COLOR_TEMP
         if self.has_config(CONF_COLOR):
             supports |= SUPPORT_COLOR | SUPPORT_BRIGHTNESS
-        if self.has_config(CONF_SCENE) or self.has_config(CONF_MUSIC_MODE):
+        if (
+            self.has_config(CONF_SCENE)
+            or self.has_config(CONF_MUSIC_MODE)
+            or self._scenes.captured
+        ):
             supports |= SUPPORT_EFFECT
         return supports
 
@@ -282,13 +405,7 @@ class LocaltuyaLight(LocalTuyaEntity, LightEntity):
         return color_mode is not None and color_mode == MODE_MUSIC
 
     def __is_color_rgb_encoded(self):
-        return len(self.dps_conf(CONF_COLOR)) > 12
-
-    def __find_scene_by_scene_data(self, data):
-        return next(
-            (item for item in self._effect_list if self._scenes.get(item) == data),
-            SCENE_CUSTOM,
-        )
+        return is_rgb_encoded(self.dps_conf(CONF_COLOR))
 
     def __get_color_mode(self):
         return (
@@ -306,7 +423,10 @@ class LocaltuyaLight(LocalTuyaEntity, LightEntity):
         brightness = None
         if ATTR_EFFECT in kwargs and (features & SUPPORT_EFFECT):
             scene = self._scenes.get(kwargs[ATTR_EFFECT])
-            if scene is not None:
+            captured = self._scenes.captured.get(kwargs[ATTR_EFFECT])
+            if captured is not None:
+                states.update(captured)
+            elif scene is not None:
                 if scene.startswith(MODE_SCENE):
                     states[self._config.get(CONF_COLOR_MODE)] = scene
                 else:
@@ -326,24 +446,13 @@ class LocaltuyaLight(LocalTuyaEntity, LightEntity):
             if self.is_white_mode:
                 states[self._config.get(CONF_BRIGHTNESS)] = brightness
             else:
-                if self.__is_color_rgb_encoded():
-                    rgb = color_util.color_hsv_to_RGB(
-                        self._hs[0],
-                        self._hs[1],
-                        int(brightness * 100 / self._upper_brightness),
-                    )
-                    color = "{:02x}{:02x}{:02x}{:04x}{:02x}{:02x}".format(
-                        round(rgb[0]),
-                        round(rgb[1]),
-                        round(rgb[2]),
-                        round(self._hs[0]),
-                        round(self._hs[1] * 255 / 100),
-                        brightness,
-                    )
-                else:
-                    color = "{:04x}{:04x}{:04x}".format(
-                        round(self._hs[0]), round(self._hs[1] * 10.0), brightness
-                    )
+                color = encode_color(
+                    self._hs[0],
+                    self._hs[1],
+                    brightness,
+                    self._upper_brightness,
+                    self.__is_color_rgb_encoded(),
+                )
                 states[self._config.get(CONF_COLOR)] = color
                 states[self._config.get(CONF_COLOR_MODE)] = MODE_COLOR
 
@@ -355,22 +464,13 @@ class LocaltuyaLight(LocalTuyaEntity, LightEntity):
                 states[self._config.get(CONF_BRIGHTNESS)] = brightness
                 states[self._config.get(CONF_COLOR_MODE)] = MODE_WHITE
             else:
-                if self.__is_color_rgb_encoded():
-                    rgb = color_util.color_hsv_to_RGB(
-                        hs[0], hs[1], int(brightness * 100 / self._upper_brightness)
-                    )
-                    color = "{:02x}{:02x}{:02x}{:04x}{:02x}{:02x}".format(
-                        round(rgb[0]),
-                        round(rgb[1]),
-                        round(rgb[2]),
-                        round(hs[0]),
-                        round(hs[1] * 255 / 100),
-                        brightness,
-                    )
-                else:
-                    color = "{:04x}{:04x}{:04x}".format(
-                        round(hs[0]), round(hs[1] * 10.0), brightness
-                    )
+                color = encode_color(
+                    hs[0],
+                    hs[1],
+                    brightness,
+                    self._upper_brightness,
+                    self.__is_color_rgb_encoded(),
+                )
                 states[self._config.get(CONF_COLOR)] = color
                 states[self._config.get(CONF_COLOR_MODE)] = MODE_COLOR
 
@@ -409,31 +509,19 @@ class LocaltuyaLight(LocalTuyaEntity, LightEntity):
         if supported & SUPPORT_COLOR:
             color = self.dps_conf(CONF_COLOR)
             if color is not None and not self.is_white_mode:
-                if self.__is_color_rgb_encoded():
-                    hue = int(color[6:10], 16)
-                    sat = int(color[10:12], 16)
-                    value = int(color[12:14], 16)
-                    self._hs = [hue, (sat * 100 / 255)]
-                    self._brightness = value
-                else:
-                    hue, sat, value = [
-                        int(value, 16) for value in textwrap.wrap(color, 4)
-                    ]
-                    self._hs = [hue, sat / 10.0]
-                    self._brightness = value
+                decoded = decode_color(color)
+                if decoded is not None:
+                    hue, sat, self._brightness = decoded
+                    self._hs = [hue, sat]
 
         if supported & SUPPORT_COLOR_TEMP:
             self._color_temp = self.dps_conf(CONF_COLOR_TEMP)
 
         if self.is_scene_mode and supported & SUPPORT_EFFECT:
             if self.dps_conf(CONF_COLOR_MODE) != MODE_SCENE:
-                self._effect = self.__find_scene_by_scene_data(
-                    self.dps_conf(CONF_COLOR_MODE)
-                )
+                self._effect = self._scenes.find(self.dps_conf(CONF_COLOR_MODE))
             else:
-                self._effect = self.__find_scene_by_scene_data(
-                    self.dps_conf(CONF_SCENE)
-                )
+                self._effect = self._scenes.find(self.dps_conf(CONF_SCENE))
                 if self._effect == SCENE_CUSTOM:
                     if SCENE_CUSTOM not in self._effect_list:
                         self._effect_list.append(SCENE_CUSTOM)
@@ -444,4 +532,18 @@ class LocaltuyaLight(LocalTuyaEntity, LightEntity):
             self._effect = SCENE_MUSIC
 
 
-async_setup_entry = partial(async_setup_entry, DOMAIN, LocaltuyaLight, flow_schema)
+async_setup_lights = partial(async_setup_platform, DOMAIN, LocaltuyaLight, flow_schema)
+
+
+async def async_setup_entry(hass, config_entry, async_add_entities):
+    """Set up lights and their scene services."""
+    await async_setup_lights(hass, config_entry, async_add_entities)
+
+    platform = entity_platform.async_get_current_platform()
+    for service, method in (
+        (SERVICE_CAPTURE_SCENE, "async_capture_scene"),
+        (SERVICE_DELETE_SCENE, "async_delete_scene"),
+    ):
+        platform.async_register_entity_service(
+            service, {vol.Required(CONF_NAME): cv.string}, method
+        )
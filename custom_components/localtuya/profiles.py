@@ -0,0 +1,69 @@
+"""Persistent profiles of device models, keyed by product key and version."""
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.profiles"
+
+# Seconds to collect profile changes before writing them to disk
+SAVE_DELAY = 30
+
+# Profile fields
+PROFILE_DPS = "dps"
+PROFILE_DEV_TYPE = "dev_type"
+PROFILE_RESET_DPIDS = "reset_dpids"
+PROFILE_UPDATE_DPS = "update_dps"
+
+
+class DeviceProfileStore:
+    """What was learned about a device model, shared by all its devices.
+
+    A profile holds the detected DPS, the device type (type_0a/type_0d), the
+    DP ids needing a reset before the device reports status and the DPS
+    accepted by update_dps, so setup and reconnects can skip detection and
+    fallback round trips.
+    """
+
+    def __init__(self, hass):
+        """Initialize an empty store."""
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._profiles = {}
+
+    async def async_load(self):
+        """Load profiles from disk."""
+        data = await self._store.async_load()
+        if data is not None:
+            self._profiles = data.get("profiles", {})
+        _LOGGER.debug("Loaded %d device profiles", len(self._profiles))
+
+    @staticmethod
+    def _key(product_key, version):
+        return f"{product_key}_{version}"
+
+    def get(self, product_key, version):
+        """Return the profile of a device model, empty if unknown."""
+        if product_key is None:
+            return {}
+        return self._profiles.get(self._key(product_key, version), {})
+
+    @callback
+    def async_update(self, product_key, version, fields):
+        """Merge a dict of fields into the profile of a device model."""
+        if product_key is None:
+            return
+        key = self._key(product_key, version)
+        profile = self._profiles.get(key, {})
+        if all(profile.get(name) == value for name, value in fields.items()):
+            return
+        self._profiles[key] = {**profile, **fields}
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self):
+        return {"profiles": self._profiles}
@@ -38,9 +38,13 @@ Functions
 import asyncio
 import base64
 import binascii
+import bisect
 import hmac
 import json
 import logging
+import random
+import re
+import secrets
 import struct
 import time
 import weakref
@@ -60,6 +64,7 @@ _LOGGER = logging.getLogger(__name__)
 # Tuya Packet Format
 TuyaHeader = namedtuple("TuyaHeader", "prefix seqno cmd length")
 MessagePayload = namedtuple("MessagePayload", "cmd payload")
+InFlightRequest = namedtuple("InFlightRequest", "future timer")
 try:
     TuyaMessage = namedtuple(
         "TuyaMessage", "seqno cmd retcode payload crc crc_good", defaults=(True,)
@@ -151,6 +156,15 @@ PREFIX_VALUE = 0x000055AA
 PREFIX_BIN = b"\x00\x00U\xaa"
 SUFFIX_VALUE = 0x0000AA55
 SUFFIX_BIN = b"\x00\x00\xaaU"
+# Precompiled codecs for the formats above
+MESSAGE_HEADER = struct.Struct(MESSAGE_HEADER_FMT)
+MESSAGE_RETCODE = struct.Struct(MESSAGE_RETCODE_FMT)
+MESSAGE_END = struct.Struct(MESSAGE_END_FMT)
+MESSAGE_END_HMAC = struct.Struct(MESSAGE_END_FMT_HMAC)
+MESSAGE_HEADER_LEN = MESSAGE_HEADER.size
+MESSAGE_RECV_HEADER_LEN = struct.calcsize(MESSAGE_RECV_HEADER_FMT)
+# sanity check. currently the max payload length is somewhere around 300 bytes
+MESSAGE_MAX_PAYLOAD_LEN = 1000
 NO_PROTOCOL_HEADER_CMDS = [
     DP_QUERY,
     DP_QUERY_NEW,
@@ -162,6 +176,23 @@ NO_PROTOCOL_HEADER_CMDS = [
 ]
 
 HEARTBEAT_INTERVAL = 10
+# Resolution (seconds) and size of the heartbeat timer wheel
+HEARTBEAT_TICK = 0.5
+HEARTBEAT_SLOTS = 128
+# Heartbeats are sent up to this fraction of the interval early to spread load
+HEARTBEAT_JITTER = 0.1
+
+# type_0d devices only report requested DPS, so detection probes DPS 2-255 in
+# chunks of DPS_PROBE_SIZE (request payloads are limited to 255 bytes) with up
+# to DPS_PROBE_WINDOW chunks in flight. Some of them ignore queries for unknown
+# DPS, so probing stops after DPS_PROBE_TIMEOUT seconds in total.
+DPS_PROBE_RANGE = range(2, 256)
+DPS_PROBE_SIZE = 10
+DPS_PROBE_WINDOW = 4
+DPS_PROBE_TIMEOUT = 30
+
+# Upper bounds (seconds) of the buckets of round-trip time histograms
+TIMING_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
 
 # DPS that are known to be safe to use with update_dps (0x12) command
 UPDATE_DPS_WHITELIST = [18, 19, 20]  # Socket (Wi-Fi)
@@ -218,6 +249,59 @@ payload_dict = {
 }
 
 
+# Placeholders for the per-message fields of a compiled payload template
+PAYLOAD_TIMESTAMP = "\0t"
+PAYLOAD_DATA = "\0d"
+PAYLOAD_PLACEHOLDER_RE = re.compile(
+    "(%s)"
+    % "|".join(re.escape(json.dumps(p)) for p in (PAYLOAD_TIMESTAMP, PAYLOAD_DATA))
+)
+# json.dumps() only reuses its default encoder, keep a compact one around
+JSON_ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+
+class EncodedDps(str):
+    """DPs already serialized to JSON, see encode_dps()."""
+
+
+def encode_dps(dps):
+    """Serialize DPs once so they can be sent to several devices."""
+    if isinstance(dps, EncodedDps):
+        return dps
+    return EncodedDps(JSON_ENCODER.encode(dps))
+
+
+class PayloadTemplate:
+    """JSON payload for one command, serialized once and filled in per message."""
+
+    def __init__(self, cmd, json_data, int_time=False):
+        """Initialize a template from a dict containing placeholders."""
+        self.cmd = cmd
+        self._int_time = int_time
+        # Placeholders end up at the odd indexes of the split text
+        self._parts = PAYLOAD_PLACEHOLDER_RE.split(JSON_ENCODER.encode(json_data))
+        self._time_slots = self._slots(PAYLOAD_TIMESTAMP)
+        self._data_slots = self._slots(PAYLOAD_DATA)
+
+    def _slots(self, placeholder):
+        token = json.dumps(placeholder)
+        return [i for i in range(1, len(self._parts), 2) if self._parts[i] == token]
+
+    def render(self, data=None):
+        """Return the encoded payload for the current time and data."""
+        parts = self._parts.copy()
+        if self._time_slots:
+            timestamp = int(time.time())
+            value = str(timestamp) if self._int_time else f'"{timestamp}"'
+            for slot in self._time_slots:
+                parts[slot] = value
+        if self._data_slots:
+            value = encode_dps(data)
+            for slot in self._data_slots:
+                parts[slot] = value
+        return "".join(parts).encode("utf-8")
+
+
 class TuyaLoggingAdapter(logging.LoggerAdapter):
     """Adapter that adds device id to all log points."""
 
@@ -265,40 +349,31 @@ class ContextualLogger:
 
 def pack_message(msg, hmac_key=None):
     """Pack a TuyaMessage into bytes."""
-    end_fmt = MESSAGE_END_FMT_HMAC if hmac_key else MESSAGE_END_FMT
-    # Create full message excluding CRC and suffix
-    buffer = (
-        struct.pack(
-            MESSAGE_HEADER_FMT,
-            PREFIX_VALUE,
-            msg.seqno,
-            msg.cmd,
-            len(msg.payload) + struct.calcsize(end_fmt),
-        )
-        + msg.payload
+    end = MESSAGE_END_HMAC if hmac_key else MESSAGE_END
+    header = MESSAGE_HEADER.pack(
+        PREFIX_VALUE, msg.seqno, msg.cmd, len(msg.payload) + end.size
     )
+    # Checksum header and payload incrementally, then join everything once
     if hmac_key:
-        crc = hmac.new(hmac_key, buffer, sha256).digest()
+        digest = hmac.new(hmac_key, header, sha256)
+        digest.update(msg.payload)
+        crc = digest.digest()
     else:
-        crc = binascii.crc32(buffer) & 0xFFFFFFFF
-    # Calculate CRC, add it together with suffix
-    buffer += struct.pack(end_fmt, crc, SUFFIX_VALUE)
-    return buffer
+        crc = binascii.crc32(msg.payload, binascii.crc32(header)) & 0xFFFFFFFF
+    return b"".join((header, msg.payload, end.pack(crc, SUFFIX_VALUE)))
 
 
 def unpack_message(data, hmac_key=None, header=None, no_retcode=False, logger=None):
     """Unpack bytes into a TuyaMessage."""
-    end_fmt = MESSAGE_END_FMT_HMAC if hmac_key else MESSAGE_END_FMT
+    end = MESSAGE_END_HMAC if hmac_key else MESSAGE_END
     # 4-word header plus return code
-    header_len = struct.calcsize(MESSAGE_HEADER_FMT)
-    retcode_len = 0 if no_retcode else struct.calcsize(MESSAGE_RETCODE_FMT)
-    end_len = struct.calcsize(end_fmt)
-    headret_len = header_len + retcode_len
+    retcode_len = 0 if no_retcode else MESSAGE_RETCODE.size
+    headret_len = MESSAGE_HEADER_LEN + retcode_len
 
-    if len(data) < headret_len + end_len:
+    if len(data) < headret_len + end.size:
         logger.debug(
             "unpack_message(): not enough data to unpack header! need %d but only have %d",
-            headret_len + end_len,
+            headret_len + end.size,
             len(data),
         )
         raise DecodeError("Not enough data to unpack header")
@@ -306,31 +381,28 @@ def unpack_message(data, hmac_key=None, header=None, no_retcode=False, logger=No
     if header is None:
         header = parse_header(data)
 
-    if len(data) < header_len + header.length:
+    frame_len = MESSAGE_HEADER_LEN + header.length
+    if len(data) < frame_len:
         logger.debug(
             "unpack_message(): not enough data to unpack payload! need %d but only have %d",
-            header_len + header.length,
+            frame_len,
             len(data),
         )
         raise DecodeError("Not enough data to unpack payload")
 
     retcode = (
-        0
-        if no_retcode
-        else struct.unpack(MESSAGE_RETCODE_FMT, data[header_len:headret_len])[0]
+        0 if no_retcode else MESSAGE_RETCODE.unpack_from(data, MESSAGE_HEADER_LEN)[0]
     )
-    # the retcode is technically part of the payload, but strip it as we do not want it here
-    payload = data[header_len + retcode_len : header_len + header.length]
-    crc, suffix = struct.unpack(end_fmt, payload[-end_len:])
-
+    crc_pos = frame_len - end.size
+    crc, suffix = end.unpack_from(data, crc_pos)
+    # Hash and slice through a memoryview so header and payload are not copied
+    view = memoryview(data)
     if hmac_key:
-        have_crc = hmac.new(
-            hmac_key, data[: (header_len + header.length) - end_len], sha256
-        ).digest()
+        have_crc = hmac.new(hmac_key, view[:crc_pos], sha256).digest()
     else:
-        have_crc = (
-            binascii.crc32(data[: (header_len + header.length) - end_len]) & 0xFFFFFFFF
-        )
+        have_crc = binascii.crc32(view[:crc_pos]) & 0xFFFFFFFF
+    # the retcode is technically part of the payload, but strip it as we do not want it here
+    payload = bytes(view[headret_len:crc_pos])
 
     if suffix != SUFFIX_VALUE:
         logger.debug("Suffix prefix wrong! %08X != %08X", suffix, SUFFIX_VALUE)
@@ -345,28 +417,21 @@ def unpack_message(data, hmac_key=None, header=None, no_retcode=False, logger=No
         else:
             logger.debug("CRC wrong! %08X != %08X", have_crc, crc)
 
-    return TuyaMessage(
-        header.seqno, header.cmd, retcode, payload[:-end_len], crc, crc == have_crc
-    )
+    return TuyaMessage(header.seqno, header.cmd, retcode, payload, crc, crc == have_crc)
 
 
 def parse_header(data):
     """Unpack bytes into a TuyaHeader."""
-    header_len = struct.calcsize(MESSAGE_HEADER_FMT)
-
-    if len(data) < header_len:
+    if len(data) < MESSAGE_HEADER_LEN:
         raise DecodeError("Not enough data to unpack header")
 
-    prefix, seqno, cmd, payload_len = struct.unpack(
-        MESSAGE_HEADER_FMT, data[:header_len]
-    )
+    prefix, seqno, cmd, payload_len = MESSAGE_HEADER.unpack_from(data)
 
     if prefix != PREFIX_VALUE:
         # self.debug('Header prefix wrong! %08X != %08X', prefix, PREFIX_VALUE)
         raise DecodeError("Header prefix wrong! %08X != %08X" % (prefix, PREFIX_VALUE))
 
-    # sanity check. currently the max payload length is somewhere around 300 bytes
-    if payload_len > 1000:
+    if payload_len > MESSAGE_MAX_PAYLOAD_LEN:
         raise DecodeError(
             "Header claims the packet size is over 1000 bytes! It is most likely corrupt. Claimed size: %d bytes"
             % payload_len
@@ -412,18 +477,25 @@ class AESCipher:
 class MessageDispatcher(ContextualLogger):
     """Buffer and dispatcher for Tuya messages."""
 
-    # Heartbeats on protocols < 3.3 respond with sequence number 0,
-    # so they can't be waited for like other messages.
-    # This is a hack to allow waiting for heartbeats.
-    HEARTBEAT_SEQNO = -100
-    RESET_SEQNO = -101
-    SESS_KEY_SEQNO = -102
+    # Responses which may not echo the sequence number of their request
+    # (e.g. heartbeats on protocols < 3.3 respond with sequence number 0),
+    # mapped to the command of the request they answer. They are matched
+    # to the oldest in-flight request of that command.
+    UNSEQUENCED_RESPONSES = {
+        HEART_BEAT: HEART_BEAT,
+        UPDATEDPS: UPDATEDPS,
+        STATUS: UPDATEDPS,
+        SESS_KEY_NEG_RESP: SESS_KEY_NEG_START,
+    }
 
-    def __init__(self, dev_id, listener, protocol_version, local_key, enable_debug):
+    def __init__(
+        self, dev_id, listener, protocol_version, local_key, enable_debug, stats=None
+    ):
         """Initialize a new MessageBuffer."""
         super().__init__()
-        self.buffer = b""
-        self.listeners = {}
+        self.buffer = bytearray()
+        self.stats = TrafficStats() if stats is None else stats
+        self.in_flight = {}
         self.listener = listener
         self.version = protocol_version
         self.local_key = local_key
@@ -431,98 +503,368 @@ class MessageDispatcher(ContextualLogger):
 
     def abort(self):
         """Abort all waiting clients."""
-        for key in self.listeners:
-            sem = self.listeners[key]
-            self.listeners[key] = None
+        in_flight, self.in_flight = self.in_flight, {}
+        for request in in_flight.values():
+            request.timer.cancel()
+            if not request.future.done():
+                request.future.set_result(None)
+
+    def register(self, seqno, cmd, timeout=5):
+        """Add a request to the in-flight table and return a future for its response.
+
+        Must be called before the request is written so that a fast response
+        cannot be missed. The future resolves to the response message, to None
+        if the dispatcher is aborted, or raises asyncio.TimeoutError once the
+        deadline passes.
+        """
+        key = (cmd, seqno)
+        if key in self.in_flight:
+            raise Exception(f"request already in flight for {key}")
 
-            # TODO: Received data and semahore should be stored separately
-            if isinstance(sem, asyncio.Semaphore):
-                sem.release()
+        self.debug("Command %d waiting for seq. number %d", cmd, seqno)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        timer = loop.call_later(timeout, self._expire, key, future)
+        self.in_flight[key] = InFlightRequest(future, timer)
+        future.add_done_callback(lambda _: self._release(key, future))
+        return future
 
     async def wait_for(self, seqno, cmd, timeout=5):
         """Wait for response to a sequence number to be received and return it."""
-        if seqno in self.listeners:
-            raise Exception(f"listener exists for {seqno}")
-
-        self.debug("Command %d waiting for seq. number %d", cmd, seqno)
-        self.listeners[seqno] = asyncio.Semaphore(0)
-        try:
-            await asyncio.wait_for(self.listeners[seqno].acquire(), timeout=timeout)
-        except asyncio.TimeoutError:
+        return await self.register(seqno, cmd, timeout)
+
+    def _release(self, key, future):
+        """Drop an in-flight request, e.g. when the waiter was cancelled."""
+        request = self.in_flight.get(key)
+        if request is not None and request.future is future:
+            del self.in_flight[key]
+            request.timer.cancel()
+
+    def _expire(self, key, future):
+        """Fail an in-flight request whose deadline has passed."""
+        self._release(key, future)
+        if not future.done():
             self.debug(
-                "Command %d timed out waiting for sequence number %d", cmd, seqno
+                "Command %d timed out waiting for sequence number %d", key[0], key[1]
             )
-            del self.listeners[seqno]
-            raise
-
-        return self.listeners.pop(seqno)
+            future.set_exception(asyncio.TimeoutError())
+
+    def _resolve(self, key, msg):
+        """Complete an in-flight request with its response."""
+        request = self.in_flight.pop(key)
+        request.timer.cancel()
+        if not request.future.done():
+            request.future.set_result(msg)
+
+    def _find_request(self, msg):
+        """Return the key of the in-flight request answered by a message."""
+        key = (msg.cmd, msg.seqno)
+        if key in self.in_flight:
+            return key
+        for key in self.in_flight:
+            if key[1] == msg.seqno:
+                return key
+        request_cmd = self.UNSEQUENCED_RESPONSES.get(msg.cmd)
+        if request_cmd is not None:
+            # Dicts keep insertion order, so the first match is the oldest
+            for key in self.in_flight:
+                if key[0] == request_cmd:
+                    return key
+        return None
 
     def add_data(self, data):
         """Add new data to the buffer and try to parse messages."""
         self.buffer += data
-        header_len = struct.calcsize(MESSAGE_RECV_HEADER_FMT)
+        stats = self.stats
+        stats.bytes_in += len(data)
+        for msg in self._parse_frames():
+            stats.messages_in += 1
+            if not msg.crc_good:
+                stats.checksum_errors += 1
+            self._dispatch(msg)
 
-        while self.buffer:
-            # Check if enough data for measage header
-            if len(self.buffer) < header_len:
-                break
+    def _parse_frames(self):
+        """Extract all complete frames from the buffer.
 
-            header = parse_header(self.buffer)
-            hmac_key = self.local_key if self.version == 3.4 else None
-            msg = unpack_message(
-                self.buffer, header=header, hmac_key=hmac_key, logger=self
-            )
-            self.buffer = self.buffer[header_len - 4 + header.length :]
-            self._dispatch(msg)
+        Frames are located by scanning for PREFIX_BIN and validated against
+        SUFFIX_BIN. Garbage and corrupt frames are skipped by resyncing on the
+        next prefix instead of failing. Frames are handed to unpack_message as
+        memoryview slices and consumed bytes are released with a single delete
+        at the end, so the buffer is never re-copied per frame.
+        """
+        buffer = self.buffer
+        hmac_key = self.local_key if self.version == 3.4 else None
+        trailer = MESSAGE_END_HMAC if hmac_key else MESSAGE_END
+        min_len = MESSAGE_RETCODE.size + trailer.size
+        messages = []
+        pos = 0
+
+        with memoryview(buffer) as view:
+            while True:
+                start = buffer.find(PREFIX_BIN, pos)
+                if start < 0:
+                    # Keep a trailing partial prefix, drop everything before it
+                    start = max(pos, len(buffer) - len(PREFIX_BIN) + 1)
+                    if start > pos:
+                        self.debug("Dropping %d bytes without prefix", start - pos)
+                    pos = start
+                    break
+                if start > pos:
+                    self.debug("Dropping %d bytes before prefix", start - pos)
+                pos = start
+
+                # Check if enough data for message header
+                if len(buffer) - start < MESSAGE_RECV_HEADER_LEN:
+                    break
+
+                _, seqno, cmd, length = MESSAGE_HEADER.unpack_from(buffer, start)
+                frame_end = start + MESSAGE_HEADER_LEN + length
+                if not min_len <= length <= MESSAGE_MAX_PAYLOAD_LEN:
+                    self.debug("Invalid frame length %d, resyncing", length)
+                    pos = start + 1
+                    continue
+                if len(buffer) < frame_end:
+                    break
+                if not buffer.startswith(SUFFIX_BIN, frame_end - len(SUFFIX_BIN)):
+                    self.debug("Frame suffix missing, resyncing")
+                    pos = start + 1
+                    continue
+
+                header = TuyaHeader(PREFIX_VALUE, seqno, cmd, length)
+                with view[start:frame_end] as frame:
+                    messages.append(
+                        unpack_message(
+                            frame, header=header, hmac_key=hmac_key, logger=self
+                        )
+                    )
+                pos = frame_end
+
+        del buffer[:pos]
+        return messages
 
     def _dispatch(self, msg):
         """Dispatch a message to someone that is listening."""
         self.debug("Dispatching message CMD %r %s", msg.cmd, msg)
-        if msg.seqno in self.listeners:
-            # self.debug("Dispatching sequence number %d", msg.seqno)
-            sem = self.listeners[msg.seqno]
-            if isinstance(sem, asyncio.Semaphore):
-                self.listeners[msg.seqno] = msg
-                sem.release()
-            else:
-                self.debug("Got additional message without request - skipping: %s", sem)
-        elif msg.cmd == HEART_BEAT:
-            self.debug("Got heartbeat response")
-            if self.HEARTBEAT_SEQNO in self.listeners:
-                sem = self.listeners[self.HEARTBEAT_SEQNO]
-                self.listeners[self.HEARTBEAT_SEQNO] = msg
-                sem.release()
-        elif msg.cmd == UPDATEDPS:
-            self.debug("Got normal updatedps response")
-            if self.RESET_SEQNO in self.listeners:
-                sem = self.listeners[self.RESET_SEQNO]
-                self.listeners[self.RESET_SEQNO] = msg
-                sem.release()
-        elif msg.cmd == SESS_KEY_NEG_RESP:
-            self.debug("Got key negotiation response")
-            if self.SESS_KEY_SEQNO in self.listeners:
-                sem = self.listeners[self.SESS_KEY_SEQNO]
-                self.listeners[self.SESS_KEY_SEQNO] = msg
-                sem.release()
+        key = self._find_request(msg)
+        if key is not None:
+            self.debug("Got response to command %d seq. number %d", *key)
+            self._resolve(key, msg)
         elif msg.cmd == STATUS:
-            if self.RESET_SEQNO in self.listeners:
-                self.debug("Got reset status update")
-                sem = self.listeners[self.RESET_SEQNO]
-                self.listeners[self.RESET_SEQNO] = msg
-                sem.release()
-            else:
-                self.debug("Got status update")
-                self.listener(msg)
+            self.debug("Got status update")
+            self.listener(msg)
+        elif msg.cmd == CONTROL_NEW:
+            self.debug("Got ACK message for command %d: will ignore it", msg.cmd)
         else:
-            if msg.cmd == CONTROL_NEW:
-                self.debug("Got ACK message for command %d: will ignore it", msg.cmd)
+            self.debug(
+                "Got message type %d for unknown listener %d: %s",
+                msg.cmd,
+                msg.seqno,
+                msg,
+            )
+
+
+class TimingStats:
+    """Count and durations of timed operations (e.g. round trips).
+
+    Durations are also counted in the buckets of a histogram with the upper
+    bounds of TIMING_BUCKETS, the last bucket holding everything slower.
+    """
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        self.count = 0
+        self.failures = 0
+        self.last = None
+        self.min = None
+        self.max = None
+        self._total = 0.0
+        self.buckets = [0] * (len(TIMING_BUCKETS) + 1)
+
+    def add(self, duration):
+        """Record the duration of a successful operation."""
+        self.last = duration
+        self.min = duration if self.min is None else min(self.min, duration)
+        self.max = duration if self.max is None else max(self.max, duration)
+        self._total += duration
+        self.count += 1
+        self.buckets[bisect.bisect_left(TIMING_BUCKETS, duration)] += 1
+
+    def merge(self, other):
+        """Add the statistics of another instance to these."""
+        if other.count:
+            self.last = other.last
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        self._total += other._total
+        self.count += other.count
+        self.failures += other.failures
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    @property
+    def mean(self):
+        """Return the mean duration."""
+        return self._total / self.count if self.count else None
+
+    def histogram(self):
+        """Return the bucket counts by upper bound."""
+        bounds = [f"<={bound}" for bound in TIMING_BUCKETS]
+        bounds.append(f">{TIMING_BUCKETS[-1]}")
+        return dict(zip(bounds, self.buckets))
+
+    def as_dict(self):
+        """Return statistics as a dict."""
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "last": self.last,
+            "min": self.min,
+            "mean": self.mean,
+            "max": self.max,
+            "histogram": self.histogram(),
+        }
+
+
+class HeartbeatStats(TimingStats):
+    """Heartbeat counters and round-trip times of a connection."""
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        super().__init__()
+        self.sent = 0
+        self.skipped = 0
+
+    def merge(self, other):
+        """Add the statistics of another instance to these."""
+        super().merge(other)
+        self.sent += other.sent
+        self.skipped += other.skipped
+
+    def as_dict(self):
+        """Return statistics as a dict."""
+        return {"sent": self.sent, "skipped": self.skipped, **super().as_dict()}
+
+
+class TrafficStats:
+    """Traffic and error counters of a connection."""
+
+    def __init__(self):
+        """Initialize empty counters."""
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.messages_in = 0
+        self.messages_out = 0
+        # Payloads which could not be decrypted or decoded, or failed the HMAC
+        # check of the session key negotiation: a sign of a wrong local_key
+        self.decode_errors = 0
+        # Frames with a wrong CRC (HMAC with protocol 3.4)
+        self.checksum_errors = 0
+        self.pushes = 0
+        # time.monotonic() of the last status update sent by the device
+        self.last_push = None
+
+    def merge(self, other):
+        """Add the counters of another instance to these."""
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+        self.messages_in += other.messages_in
+        self.messages_out += other.messages_out
+        self.decode_errors += other.decode_errors
+        self.checksum_errors += other.checksum_errors
+        self.pushes += other.pushes
+        if other.last_push is not None:
+            self.last_push = max(self.last_push or 0, other.last_push)
+
+    @property
+    def since_last_push(self):
+        """Return the seconds since the last status update, None if none."""
+        if self.last_push is None:
+            return None
+        return time.monotonic() - self.last_push
+
+    def as_dict(self):
+        """Return counters as a dict."""
+        return {
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "messages_in": self.messages_in,
+            "messages_out": self.messages_out,
+            "decode_errors": self.decode_errors,
+            "checksum_errors": self.checksum_errors,
+            "pushes": self.pushes,
+            "since_last_push": self.since_last_push,
+        }
+
+
+class HeartbeatScheduler:
+    """Timer wheel driving the heartbeats of all connections on an event loop.
+
+    A single timer ticks every HEARTBEAT_TICK seconds while connections are
+    scheduled, instead of one sleeping task per device. Delays longer than
+    the wheel wrap around and are counted down in rounds.
+    """
+
+    def __init__(self, loop):
+        """Initialize an empty wheel."""
+        self.loop = loop
+        self._wheel = [{} for _ in range(HEARTBEAT_SLOTS)]
+        self._slots = {}
+        self._cursor = 0
+        self._timer = None
+        self._next_tick = None
+
+    def schedule(self, protocol, delay):
+        """Call protocol.heartbeat_due() after delay seconds (minus jitter)."""
+        self.cancel(protocol)
+        delay *= 1 - random.random() * HEARTBEAT_JITTER
+        ticks = max(1, round(delay / HEARTBEAT_TICK))
+        slot = (self._cursor + ticks) % HEARTBEAT_SLOTS
+        self._wheel[slot][protocol] = (ticks - 1) // HEARTBEAT_SLOTS
+        self._slots[protocol] = slot
+        if self._timer is None:
+            self._next_tick = self.loop.time() + HEARTBEAT_TICK
+            self._timer = self.loop.call_at(self._next_tick, self._tick)
+
+    def cancel(self, protocol):
+        """Remove a protocol from the wheel."""
+        slot = self._slots.pop(protocol, None)
+        if slot is not None:
+            del self._wheel[slot][protocol]
+
+    def _tick(self):
+        self._cursor = (self._cursor + 1) % HEARTBEAT_SLOTS
+        bucket = self._wheel[self._cursor]
+        due = []
+        for protocol, rounds in bucket.items():
+            if rounds:
+                bucket[protocol] = rounds - 1
             else:
-                self.debug(
-                    "Got message type %d for unknown listener %d: %s",
-                    msg.cmd,
-                    msg.seqno,
-                    msg,
-                )
+                due.append(protocol)
+        for protocol in due:
+            del bucket[protocol]
+            del self._slots[protocol]
+            delay = protocol.heartbeat_due()
+            if delay is not None:
+                self.schedule(protocol, delay)
+
+        if self._slots:
+            # Advance from the planned tick so the wheel does not drift
+            self._next_tick = max(
+                self._next_tick + HEARTBEAT_TICK, self.loop.time() + HEARTBEAT_TICK / 2
+            )
+            self._timer = self.loop.call_at(self._next_tick, self._tick)
+        else:
+            self._timer = None
+
+
+_HEARTBEAT_SCHEDULERS = weakref.WeakKeyDictionary()
+
+
+def heartbeat_scheduler(loop):
+    """Return the heartbeat scheduler shared by all connections on a loop."""
+    scheduler = _HEARTBEAT_SCHEDULERS.get(loop)
+    if scheduler is None:
+        scheduler = _HEARTBEAT_SCHEDULERS[loop] = HeartbeatScheduler(loop)
+    return scheduler
 
 
 class TuyaListener(ABC):
@@ -580,15 +922,26 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
             # them (such as BulbDevice) make connections when called
             TuyaProtocol.set_version(self, 3.1)
 
-        self.cipher = AESCipher(self.local_key)
+        self._ciphers = {}
+        self._payload_templates = {}
+        self._negotiation = None
+        self.session_key_stats = TimingStats()
         self.seqno = 1
         self.transport = None
         self.listener = weakref.ref(listener)
+        self.traffic_stats = TrafficStats()
+        self.command_stats = TimingStats()
         self.dispatcher = self._setup_dispatcher(enable_debug)
         self.on_connected = on_connected
         self.heartbeater = None
+        self.heartbeat_interval = HEARTBEAT_INTERVAL
+        self.heartbeat_stats = HeartbeatStats()
+        self.last_rx = self.last_tx = self.loop.time()
         self.dps_cache = {}
-        self.local_nonce = b"0123456789abcdef"  # not-so-random random key
+        # DPS expected from a device of this model, speeds up detection
+        self.known_dps = None
+        self.update_dps_whitelist = UPDATE_DPS_WHITELIST
+        self.local_nonce = b""
         self.remote_nonce = b""
 
     def set_version(self, protocol_version):
@@ -618,7 +971,10 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
     def _setup_dispatcher(self, enable_debug):
         def _status_update(msg):
             if msg.seqno > 0:
-                self.seqno = msg.seqno + 1
+                # Only move forward so pipelined requests never reuse a seqno
+                self.seqno = max(self.seqno, msg.seqno + 1)
+            self.traffic_stats.pushes += 1
+            self.traffic_stats.last_push = time.monotonic()
             decoded_message = self._decode_payload(msg.payload)
             if "dps" in decoded_message:
                 self.dps_cache.update(decoded_message["dps"])
@@ -628,49 +984,84 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
                 listener.status_updated(self.dps_cache)
 
         return MessageDispatcher(
-            self.id, _status_update, self.version, self.local_key, enable_debug
+            self.id,
+            _status_update,
+            self.version,
+            self.local_key,
+            enable_debug,
+            self.traffic_stats,
         )
 
     def connection_made(self, transport):
         """Did connect to the device."""
         self.transport = transport
+        if self.version == 3.4:
+            # Negotiate while the caller prepares its first request
+            self._start_negotiation()
         self.on_connected.set_result(True)
 
-    def start_heartbeat(self):
+    def start_heartbeat(self, interval=HEARTBEAT_INTERVAL):
         """Start the heartbeat transmissions with the device."""
+        self.debug("Started heartbeat every %ss", interval)
+        self.heartbeat_interval = interval
+        # Random first delay so devices connected together do not beat together
+        heartbeat_scheduler(self.loop).schedule(self, random.random() * interval)
 
-        async def heartbeat_loop():
-            """Continuously send heart beat updates."""
-            self.debug("Started heartbeat loop")
-            while True:
-                try:
-                    await self.heartbeat()
-                    await asyncio.sleep(HEARTBEAT_INTERVAL)
-                except asyncio.CancelledError:
-                    self.debug("Stopped heartbeat loop")
-                    raise
-                except asyncio.TimeoutError:
-                    self.debug("Heartbeat failed due to timeout, disconnecting")
-                    break
-                except Exception as ex:  # pylint: disable=broad-except
-                    self.exception("Heartbeat failed (%s), disconnecting", ex)
-                    break
+    def heartbeat_due(self):
+        """Send a heartbeat unless the connection saw traffic recently.
 
-            transport = self.transport
-            self.transport = None
-            transport.close()
+        Called by the heartbeat scheduler, returns the delay until the next
+        check or None while a heartbeat is in flight.
+        """
+        if self.transport is None or self.heartbeater is not None:
+            return None
+        idle = self.loop.time() - min(self.last_tx, self.last_rx)
+        if idle < self.heartbeat_interval - HEARTBEAT_TICK:
+            self.heartbeat_stats.skipped += 1
+            return self.heartbeat_interval - idle
+        self.heartbeater = self.loop.create_task(self._send_heartbeat())
+        return None
 
-        self.heartbeater = self.loop.create_task(heartbeat_loop())
+    async def _send_heartbeat(self):
+        """Send a single heartbeat and schedule the next one."""
+        self.heartbeat_stats.sent += 1
+        start = self.loop.time()
+        try:
+            await self.heartbeat()
+        except asyncio.CancelledError:
+            self.debug("Stopped heartbeat")
+            raise
+        except asyncio.TimeoutError:
+            self.heartbeat_stats.failures += 1
+            self.debug("Heartbeat failed due to timeout, disconnecting")
+        except Exception as ex:  # pylint: disable=broad-except
+            self.heartbeat_stats.failures += 1
+            self.exception("Heartbeat failed (%s), disconnecting", ex)
+        else:
+            self.heartbeat_stats.add(self.loop.time() - start)
+            self.heartbeater = None
+            heartbeat_scheduler(self.loop).schedule(self, self.heartbeat_interval)
+            return
+
+        self.heartbeater = None
+        transport = self.transport
+        self.transport = None
+        if transport is not None:
+            transport.close()
 
     def data_received(self, data):
         """Received data from device."""
         # self.debug("received data=%r", binascii.hexlify(data))
+        self.last_rx = self.loop.time()
         self.dispatcher.add_data(data)
 
     def connection_lost(self, exc):
         """Disconnected from device."""
         self.debug("Connection lost: %s", exc)
-        self.real_local_key = self.local_key
+        self._restore_local_key()
+        heartbeat_scheduler(self.loop).cancel(self)
+        if self._negotiation is not None:
+            self._negotiation.cancel()
         try:
             listener = self.listener and self.listener()
             if listener is not None:
@@ -681,7 +1072,11 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
     async def close(self):
         """Close connection and abort all outstanding listeners."""
         self.debug("Closing connection")
-        self.real_local_key = self.local_key
+        self._restore_local_key()
+        heartbeat_scheduler(self.loop).cancel(self)
+        if self._negotiation is not None:
+            self._negotiation.cancel()
+            self._negotiation = None
         if self.heartbeater is not None:
             self.heartbeater.cancel()
             try:
@@ -704,6 +1099,7 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
                 "[" + self.id + "] send quick failed, could not get socket: %s", payload
             )
             return None
+        seqno = self.seqno
         enc_payload = (
             self._encode_message(payload)
             if isinstance(payload, MessagePayload)
@@ -711,16 +1107,18 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
         )
         # self.debug("Quick-dispatching message %s, seqno %s", binascii.hexlify(enc_payload), self.seqno)
 
+        response = (
+            self.dispatcher.register(seqno, payload.cmd) if recv_retries else None
+        )
         try:
             self.transport.write(enc_payload)
         except Exception:
             # self._check_socket_close(True)
-            self.close()
+            await self.close()
             return None
         while recv_retries:
             try:
-                seqno = MessageDispatcher.SESS_KEY_SEQNO
-                msg = await self.dispatcher.wait_for(seqno, payload.cmd)
+                msg = await response
                 # for 3.4 devices, we get the starting seqno with the SESS_KEY_NEG_RESP message
                 self.seqno = msg.seqno
             except Exception:
@@ -732,19 +1130,21 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
                 self.debug(
                     "received null payload (%r) but out of recv retries, giving up", msg
                 )
+            elif self.dispatcher is None:
+                return None
             else:
                 self.debug(
                     "received null payload (%r), fetch new one - %s retries remaining",
                     msg,
                     recv_retries,
                 )
+                response = self.dispatcher.register(seqno, payload.cmd)
         return None
 
     async def exchange(self, command, dps=None):
         """Send and receive a message, returning response from device."""
-        if self.version == 3.4 and self.real_local_key == self.local_key:
-            self.debug("3.4 device: negotiating a new session key")
-            await self._negotiate_session_key()
+        if self.version == 3.4:
+            await self._wait_for_session_key()
 
         self.debug(
             "Sending command %s (device type: %s)",
@@ -756,20 +1156,25 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
         dev_type = self.dev_type
         # self.debug("Exchange: payload %r %r", payload.cmd, payload.payload)
 
-        # Wait for special sequence number if heartbeat or reset
         seqno = self.seqno
-
-        if payload.cmd == HEART_BEAT:
-            seqno = MessageDispatcher.HEARTBEAT_SEQNO
-        elif payload.cmd == UPDATEDPS:
-            seqno = MessageDispatcher.RESET_SEQNO
-
         enc_payload = self._encode_message(payload)
+        # Register before writing: responses may arrive out of order while
+        # other requests are in flight on the same connection
+        response = self.dispatcher.register(seqno, payload.cmd)
+        start = self.loop.time()
         self.transport.write(enc_payload)
-        msg = await self.dispatcher.wait_for(seqno, payload.cmd)
+        try:
+            msg = await response
+        except asyncio.TimeoutError:
+            if command != HEART_BEAT:
+                self.command_stats.failures += 1
+            raise
         if msg is None:
             self.debug("Wait was aborted for seqno %d", seqno)
             return None
+        if command != HEART_BEAT:
+            # Heartbeats have their own statistics
+            self.command_stats.add(self.loop.time() - start)
 
         # TODO: Verify stuff, e.g. CRC sequence number?
         if real_cmd in [HEART_BEAT, CONTROL, CONTROL_NEW] and len(msg.payload) == 0:
@@ -820,11 +1225,11 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
         if self.version in [3.2, 3.3, 3.4]:  # 3.2 behaves like 3.3 with type_0d
             if dps is None:
                 if not self.dps_cache:
-                    await self.detect_available_dps()
+                    await self.detect_available_dps(self.known_dps)
                 if self.dps_cache:
                     dps = [int(dp) for dp in self.dps_cache]
                     # filter non whitelisted dps
-                    dps = list(set(dps).intersection(set(UPDATE_DPS_WHITELIST)))
+                    dps = list(set(dps).intersection(set(self.update_dps_whitelist)))
             self.debug("updatedps() entry (dps %s, dps_cache %s)", dps, self.dps_cache)
             payload = self._generate_payload(UPDATEDPS, dps)
             enc_payload = self._encode_message(payload)
@@ -845,33 +1250,73 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
         """Set values for a set of datapoints."""
         return await self.exchange(CONTROL, dps)
 
-    async def detect_available_dps(self):
-        """Return which datapoints are supported by the device."""
-        # type_0d devices need a sort of bruteforce querying in order to detect the
-        # list of available dps experience shows that the dps available are usually
-        # in the ranges [1-25] and [100-110] need to split the bruteforcing in
-        # different steps due to request payload limitation (max. length = 255)
+    async def detect_available_dps(self, known_dps=None):
+        """Return which datapoints are supported by the device.
+
+        A plain DP_QUERY returns all DPS of most devices. type_0d devices only
+        report the DPS they are asked for, so unless all known_dps (e.g. those
+        of another device of the same model) show up, the remaining DPS are
+        probed in pipelined chunks, splitting chunks the device rejects.
+        Probing gives up after DPS_PROBE_TIMEOUT seconds and returns the DPS
+        found so far.
+        """
         self.dps_cache = {}
-        ranges = [(2, 11), (11, 21), (21, 31), (100, 111)]
+        # dps 1 must always be sent, otherwise it might fail in case no dps is
+        # found in the requested range
+        self.dps_to_request = {"1": None}
+        self.add_dps_to_request(int(dp) for dp in known_dps or ())
+        try:
+            await self.status()
+        except Exception as ex:
+            self.exception("Failed to get status: %s", ex)
+            raise
 
-        for dps_range in ranges:
-            # dps 1 must always be sent, otherwise it might fail in case no dps is found
-            # in the requested range
-            self.dps_to_request = {"1": None}
-            self.add_dps_to_request(range(*dps_range))
+        if self.dev_type == "type_0d" and (
+            not known_dps or not all(str(dp) in self.dps_cache for dp in known_dps)
+        ):
+            window = asyncio.Semaphore(DPS_PROBE_WINDOW)
+            candidates = [dp for dp in DPS_PROBE_RANGE if str(dp) not in self.dps_cache]
             try:
-                data = await self.status()
-            except Exception as ex:
-                self.exception("Failed to get status: %s", ex)
-                raise
-            if "dps" in data:
-                self.dps_cache.update(data["dps"])
+                await asyncio.wait_for(
+                    asyncio.gather(
+                        *(
+                            self._probe_dps(candidates[i : i + DPS_PROBE_SIZE], window)
+                            for i in range(0, len(candidates), DPS_PROBE_SIZE)
+                        )
+                    ),
+                    DPS_PROBE_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                self.warning("Probing dps timed out, keeping those found so far")
+            self.add_dps_to_request(int(dp) for dp in self.dps_cache)
 
-            if self.dev_type == "type_0a":
-                return self.dps_cache
         self.debug("Detected dps: %s", self.dps_cache)
         return self.dps_cache
 
+    async def _probe_dps(self, dps, window):
+        """Query a chunk of DPS, splitting it in halves if the query fails.
+
+        A chunk without response counts as having no DPS, devices ignoring
+        unknown DPS would not answer its halves either.
+        """
+        request = {"1": None}
+        request.update({str(dp): None for dp in dps})
+        async with window:
+            try:
+                data = await self.exchange(DP_QUERY, request)
+            except asyncio.TimeoutError:
+                self.debug("Query for dps %s timed out", dps)
+                return
+
+        if data and "dps" in data:
+            self.dps_cache.update(data["dps"])
+        elif data and "Err" in data and len(dps) > 1:
+            self.debug("Query for dps %s failed, splitting it", dps)
+            half = len(dps) // 2
+            await asyncio.gather(
+                self._probe_dps(dps[:half], window), self._probe_dps(dps[half:], window)
+            )
+
     def add_dps_to_request(self, dp_indicies):
         """Add a datapoint (DP) to be included in requests."""
         if isinstance(dp_indicies, int):
@@ -879,8 +1324,30 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
         else:
             self.dps_to_request.update({str(index): None for index in dp_indicies})
 
+    def _get_cipher(self, key=None):
+        """Return a cached cipher for key (defaults to the current local_key)."""
+        if key is None:
+            key = self.local_key
+        cipher = self._ciphers.get(key)
+        if cipher is None:
+            cipher = self._ciphers[key] = AESCipher(key)
+        return cipher
+
+    def _set_local_key(self, key):
+        """Switch the key used for messages and drop ciphers no longer used."""
+        self.local_key = key
+        if self.dispatcher is not None:
+            self.dispatcher.local_key = key
+        for cached_key in list(self._ciphers):
+            if cached_key not in (key, self.real_local_key):
+                del self._ciphers[cached_key]
+
+    def _restore_local_key(self):
+        """Go back to the real local key, discarding any 3.4 session key."""
+        self._set_local_key(self.real_local_key)
+
     def _decode_payload(self, payload):
-        cipher = AESCipher(self.local_key)
+        cipher = self._get_cipher()
 
         if self.version == 3.4:
             # 3.4 devices encrypt the version header in addition to the payload
@@ -891,6 +1358,7 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
                 self.debug(
                     "incomplete payload=%r with len:%d (%s)", payload, len(payload), ex
                 )
+                self.traffic_stats.decode_errors += 1
                 return self.error_json(ERR_PAYLOAD)
 
             # self.debug("decrypted 3.x payload=%r", payload)
@@ -922,6 +1390,7 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
                         len(payload),
                         ex,
                     )
+                    self.traffic_stats.decode_errors += 1
                     return self.error_json(ERR_PAYLOAD)
 
                 # self.debug("decrypted 3.x payload=%r", payload)
@@ -932,6 +1401,7 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
                     payload = payload.decode()
                 except Exception as ex:
                     self.debug("payload was not string type and decoding failed")
+                    self.traffic_stats.decode_errors += 1
                     raise DecodeError("payload was not a string: %s" % ex)
                     # return self.error_json(ERR_JSON, payload)
 
@@ -952,6 +1422,7 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
         try:
             json_payload = json.loads(payload)
         except Exception as ex:
+            self.traffic_stats.decode_errors += 1
             raise DecodeError(
                 "could not decrypt data: wrong local_key? (exception: %s)" % ex
             )
@@ -967,8 +1438,44 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
 
         return json_payload
 
+    def _start_negotiation(self):
+        """Start negotiating a session key in the background."""
+        self.debug("3.4 device: negotiating a new session key")
+        self._negotiation = self.loop.create_task(self._timed_negotiation())
+
+    async def _wait_for_session_key(self):
+        """Wait for the session key, (re)negotiating it if there is none."""
+        if self._negotiation is None or (
+            self._negotiation.done() and self.real_local_key == self.local_key
+        ):
+            self._start_negotiation()
+        # Shielded: the negotiation is shared by all pipelined exchanges
+        negotiation = self._negotiation
+        try:
+            await asyncio.shield(negotiation)
+        except asyncio.CancelledError:
+            if not negotiation.cancelled():
+                raise
+            # Cancelled by close() or connection_lost(), not by our caller
+            raise ConnectionError("connection closed during session key negotiation")
+
+    async def _timed_negotiation(self):
+        start = self.loop.time()
+        try:
+            success = await self._negotiate_session_key()
+        except Exception as ex:  # pylint: disable=broad-except
+            self.debug("Session key negotiation failed: %s", ex)
+            success = False
+        if success:
+            self.session_key_stats.add(self.loop.time() - start)
+            self.debug("Session key negotiated in %.3fs", self.session_key_stats.last)
+        else:
+            self.session_key_stats.failures += 1
+
     async def _negotiate_session_key(self):
-        self.local_key = self.real_local_key
+        self._restore_local_key()
+        # Fresh nonce per negotiation, sent as 16 ASCII characters
+        self.local_nonce = secrets.token_hex(8).encode()
 
         rkey = await self.exchange_quick(
             MessagePayload(SESS_KEY_NEG_START, self.local_nonce), 2
@@ -987,7 +1494,7 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
         payload = rkey.payload
         try:
             # self.debug("decrypting %r using %r", payload, self.real_local_key)
-            cipher = AESCipher(self.real_local_key)
+            cipher = self._get_cipher(self.real_local_key)
             payload = cipher.decrypt(payload, False, decode_text=False)
         except Exception as ex:
             self.debug(
@@ -996,6 +1503,7 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
                 len(payload),
                 ex,
             )
+            self.traffic_stats.decode_errors += 1
             return False
 
         self.debug("decrypted session key negotiation step 2: payload=%r", payload)
@@ -1013,44 +1521,44 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
                 binascii.hexlify(hmac_check),
                 binascii.hexlify(payload[16:48]),
             )
+            self.traffic_stats.decode_errors += 1
 
         # self.debug("session local nonce: %r remote nonce: %r", self.local_nonce, self.remote_nonce)
         rkey_hmac = hmac.new(self.local_key, self.remote_nonce, sha256).digest()
         await self.exchange_quick(MessagePayload(SESS_KEY_NEG_FINISH, rkey_hmac), None)
 
-        self.local_key = bytes(
+        session_key = bytes(
             [a ^ b for (a, b) in zip(self.local_nonce, self.remote_nonce)]
         )
-        # self.debug("Session nonce XOR'd: %r" % self.local_key)
+        # self.debug("Session nonce XOR'd: %r" % session_key)
 
-        cipher = AESCipher(self.real_local_key)
-        self.local_key = self.dispatcher.local_key = cipher.encrypt(
-            self.local_key, False, pad=False
-        )
+        cipher = self._get_cipher(self.real_local_key)
+        self._set_local_key(cipher.encrypt(session_key, False, pad=False))
         self.debug("Session key negotiate success! session key: %r", self.local_key)
         return True
 
     # adds protocol header (if needed) and encrypts
     def _encode_message(self, msg):
+        self.last_tx = self.loop.time()
         hmac_key = None
         payload = msg.payload
-        self.cipher = AESCipher(self.local_key)
+        cipher = self._get_cipher()
         if self.version == 3.4:
             hmac_key = self.local_key
             if msg.cmd not in NO_PROTOCOL_HEADER_CMDS:
                 # add the 3.x header
                 payload = self.version_header + payload
             self.debug("final payload for cmd %r: %r", msg.cmd, payload)
-            payload = self.cipher.encrypt(payload, False)
+            payload = cipher.encrypt(payload, False)
         elif self.version >= 3.2:
             # expect to connect and then disconnect to set new
-            payload = self.cipher.encrypt(payload, False)
+            payload = cipher.encrypt(payload, False)
             if msg.cmd not in NO_PROTOCOL_HEADER_CMDS:
                 # add the 3.x header
                 payload = self.version_header + payload
         elif msg.cmd == CONTROL:
             # need to encrypt
-            payload = self.cipher.encrypt(payload)
+            payload = cipher.encrypt(payload)
             preMd5String = (
                 b"data="
                 + payload
@@ -1069,10 +1577,11 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
                 + payload
             )
 
-        self.cipher = None
         msg = TuyaMessage(self.seqno, msg.cmd, 0, payload, 0, True)
         self.seqno += 1  # increase message sequence number
         buffer = pack_message(msg, hmac_key=hmac_key)
+        self.traffic_stats.bytes_out += len(buffer)
+        self.traffic_stats.messages_out += 1
         # self.debug("payload encrypted with key %r => %r", self.local_key, binascii.hexlify(buffer))
         return buffer
 
@@ -1089,29 +1598,36 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
             devId(str, optional): Will be used for devId
             uid(str, optional): Will be used for uid
         """
+        if data is None and self.dev_type == "type_0d" and command == DP_QUERY:
+            data = self.dps_to_request
+
+        if gwId is None and devId is None and uid is None:
+            key = (self.dev_type, command, data is not None)
+            template = self._payload_templates.get(key)
+            if template is None:
+                template = self._payload_templates[key] = self._compile_payload(
+                    command, data is not None
+                )
+        else:
+            template = self._compile_payload(
+                command, data is not None, gwId, devId, uid
+            )
+
+        payload = template.render(data)
+        self.debug("Sending payload: %s", payload)
+
+        return MessagePayload(template.cmd, payload)
+
+    def _compile_payload(self, command, has_data, gwId=None, devId=None, uid=None):
+        """Build the payload template of a command for the current device type."""
         json_data = command_override = None
 
-        if command in payload_dict[self.dev_type]:
-            if "command" in payload_dict[self.dev_type][command]:
-                json_data = payload_dict[self.dev_type][command]["command"]
-            if "command_override" in payload_dict[self.dev_type][command]:
-                command_override = payload_dict[self.dev_type][command][
-                    "command_override"
-                ]
-
-        if self.dev_type != "type_0a":
-            if (
-                json_data is None
-                and command in payload_dict["type_0a"]
-                and "command" in payload_dict["type_0a"][command]
-            ):
-                json_data = payload_dict["type_0a"][command]["command"]
-            if (
-                command_override is None
-                and command in payload_dict["type_0a"]
-                and "command_override" in payload_dict["type_0a"][command]
-            ):
-                command_override = payload_dict["type_0a"][command]["command_override"]
+        for dev_type in (self.dev_type, "type_0a"):
+            entry = payload_dict[dev_type].get(command, {})
+            if json_data is None:
+                json_data = entry.get("command")
+            if command_override is None:
+                command_override = entry.get("command_override")
 
         if command_override is None:
             command_override = command
@@ -1120,46 +1636,24 @@ class TuyaProtocol(asyncio.Protocol, ContextualLogger):
             # complain about missing attribs, so just include them all unless otherwise specified
             json_data = {"gwId": "", "devId": "", "uid": "", "t": ""}
 
-        if "gwId" in json_data:
-            if gwId is not None:
-                json_data["gwId"] = gwId
-            else:
-                json_data["gwId"] = self.id
-        if "devId" in json_data:
-            if devId is not None:
-                json_data["devId"] = devId
-            else:
-                json_data["devId"] = self.id
-        if "uid" in json_data:
-            if uid is not None:
-                json_data["uid"] = uid
-            else:
-                json_data["uid"] = self.id
+        # Work on a copy, payload_dict is shared by all devices
+        json_data = dict(json_data)
+        for field, value in (("gwId", gwId), ("devId", devId), ("uid", uid)):
+            if field in json_data:
+                json_data[field] = self.id if value is None else value
+        int_time = json_data.get("t") == "int"
         if "t" in json_data:
-            if json_data["t"] == "int":
-                json_data["t"] = int(time.time())
-            else:
-                json_data["t"] = str(int(time.time()))
+            json_data["t"] = PAYLOAD_TIMESTAMP
 
-        if data is not None:
+        if has_data:
             if "dpId" in json_data:
-                json_data["dpId"] = data
+                json_data["dpId"] = PAYLOAD_DATA
             elif "data" in json_data:
-                json_data["data"] = {"dps": data}
+                json_data["data"] = {"dps": PAYLOAD_DATA}
             else:
-                json_data["dps"] = data
-        elif self.dev_type == "type_0d" and command == DP_QUERY:
-            json_data["dps"] = self.dps_to_request
-
-        if json_data == "":
-            payload = ""
-        else:
-            payload = json.dumps(json_data)
-        # if spaces are not removed device does not respond!
-        payload = payload.replace(" ", "").encode("utf-8")
-        self.debug("Sending payload: %s", payload)
+                json_data["dps"] = PAYLOAD_DATA
 
-        return MessagePayload(command_override, payload)
+        return PayloadTemplate(command_override, json_data, int_time)
 
     def __repr__(self):
         """Return internal string representation of object."""
@@ -0,0 +1,61 @@
+"""Persistent scenes captured from the state of lights, keyed by entity."""
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.scenes"
+
+# Seconds to collect scene changes before writing them to disk
+SAVE_DELAY = 10
+
+
+class CapturedSceneStore:
+    """Scenes users captured from lights, replayed with a single set_dps.
+
+    A scene maps DP ids to the values they had when it was captured.
+    """
+
+    def __init__(self, hass):
+        """Initialize an empty store."""
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._scenes = {}
+
+    async def async_load(self):
+        """Load scenes from disk."""
+        data = await self._store.async_load()
+        if data is not None:
+            self._scenes = data.get("scenes", {})
+        _LOGGER.debug("Loaded captured scenes of %d lights", len(self._scenes))
+
+    def get(self, unique_id):
+        """Return the scenes of a light by name."""
+        return self._scenes.get(unique_id, {})
+
+    @callback
+    def async_capture(self, unique_id, name, dps):
+        """Add or replace a scene of a light."""
+        self._scenes[unique_id] = {**self.get(unique_id), name: dps}
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def async_delete(self, unique_id, name):
+        """Delete a scene of a light, return whether it existed."""
+        scenes = dict(self.get(unique_id))
+        if scenes.pop(name, None) is None:
+            return False
+        if scenes:
+            self._scenes[unique_id] = scenes
+        else:
+            del self._scenes[unique_id]
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+        return True
+
+    @callback
+    def _data_to_save(self):
+        return {"scenes": self._scenes}
@@ -1,22 +1,118 @@
 """Platform to present any Tuya DP as a sensor."""
 import logging
+import time
 from functools import partial
 
 import voluptuous as vol
-from homeassistant.components.sensor import DEVICE_CLASSES, DOMAIN
+from homeassistant.components.sensor import (
+    DEVICE_CLASSES,
+    DOMAIN,
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
 from homeassistant.const import (
     CONF_DEVICE_CLASS,
+    CONF_DEVICE_ID,
+    CONF_FRIENDLY_NAME,
     CONF_UNIT_OF_MEASUREMENT,
     STATE_UNKNOWN,
+    EntityCategory,
+    UnitOfTime,
 )
 
-from .common import LocalTuyaEntity, async_setup_entry
-from .const import CONF_SCALING
+from .common import LocalTuyaEntity
+from .common import async_setup_entry as async_setup_platform
+from .const import (
+    CONF_AGGREGATION,
+    CONF_DEADBAND,
+    CONF_DEADBAND_PERCENT,
+    CONF_MAX_SILENCE,
+    CONF_MIN_INTERVAL,
+    CONF_SCALING,
+    DATA_DEVICE_INDEX,
+    TUYA_DEVICES,
+)
+from .const import DOMAIN as LOCALTUYA_DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
 
 DEFAULT_PRECISION = 2
 
+# Value published after holding back updates of a numeric sensor
+AGGREGATION_LAST = "last"
+AGGREGATION_MEAN = "mean"
+AGGREGATION_MIN = "min"
+AGGREGATION_MAX = "max"
+# Each one takes the count, sum, minimum, maximum and last of the values
+AGGREGATIONS = {
+    AGGREGATION_LAST: lambda count, total, low, high, last: last,
+    AGGREGATION_MEAN: lambda count, total, low, high, last: round(
+        total / count, DEFAULT_PRECISION
+    ),
+    AGGREGATION_MIN: lambda count, total, low, high, last: low,
+    AGGREGATION_MAX: lambda count, total, low, high, last: high,
+}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _milliseconds(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def _seconds(seconds):
+    return None if seconds is None else round(seconds)
+
+
+# Diagnostic sensors of a device: key, name, unit, device class, state class
+# and a function returning the value from the connection statistics
+DIAGNOSTIC_SENSORS = (
+    (
+        "command_rtt",
+        "Command round trip",
+        UnitOfTime.MILLISECONDS,
+        SensorDeviceClass.DURATION,
+        SensorStateClass.MEASUREMENT,
+        lambda stats: _milliseconds(stats["command"]["mean"]),
+    ),
+    (
+        "heartbeat_rtt",
+        "Heartbeat round trip",
+        UnitOfTime.MILLISECONDS,
+        SensorDeviceClass.DURATION,
+        SensorStateClass.MEASUREMENT,
+        lambda stats: _milliseconds(stats["heartbeat"]["mean"]),
+    ),
+    (
+        "disconnects",
+        "Disconnects",
+        None,
+        None,
+        SensorStateClass.TOTAL_INCREASING,
+        lambda stats: stats["disconnects"],
+    ),
+    (
+        "errors",
+        "Protocol errors",
+        None,
+        None,
+        SensorStateClass.TOTAL_INCREASING,
+        lambda stats: stats["traffic"]["decode_errors"]
+        + stats["traffic"]["checksum_errors"],
+    ),
+    (
+        "since_last_push",
+        "Time since last update",
+        UnitOfTime.SECONDS,
+        SensorDeviceClass.DURATION,
+        SensorStateClass.MEASUREMENT,
+        lambda stats: _seconds(stats["traffic"]["since_last_push"]),
+    ),
+)
+
 
 def flow_schema(dps):
     """Return schema used in config flow."""
@@ -26,9 +122,101 @@ def flow_schema(dps):
         vol.Optional(CONF_SCALING): vol.All(
             vol.Coerce(float), vol.Range(min=-1000000.0, max=1000000.0)
         ),
+        vol.Optional(CONF_DEADBAND): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        vol.Optional(CONF_DEADBAND_PERCENT): vol.All(
+            vol.Coerce(float), vol.Range(min=0, max=100)
+        ),
+        vol.Optional(CONF_MIN_INTERVAL): vol.All(
+            vol.Coerce(float), vol.Range(min=0, max=86400)
+        ),
+        vol.Optional(CONF_MAX_SILENCE): vol.All(
+            vol.Coerce(float), vol.Range(min=0, max=86400)
+        ),
+        vol.Optional(CONF_AGGREGATION, default=AGGREGATION_LAST): vol.In(
+            list(AGGREGATIONS)
+        ),
     }
 
 
+class PublishLimiter:
+    """Decide when a numeric sensor publishes its value.
+
+    Values within the deadband (absolute or relative to the published value)
+    of the published value are held back for up to max_silence seconds, and
+    values are published at most once every min_interval seconds. Values
+    received in between are aggregated into the next published one, keeping
+    only running totals however chatty the device is.
+    """
+
+    def __init__(
+        self,
+        deadband=0,
+        deadband_percent=0,
+        min_interval=0,
+        max_silence=None,
+        aggregation=AGGREGATION_LAST,
+    ):
+        """Initialize a limiter which did not publish anything yet."""
+        self._deadband = deadband
+        self._deadband_ratio = deadband_percent / 100
+        self._min_interval = min_interval
+        self._max_silence = max_silence
+        self._aggregate = AGGREGATIONS[aggregation]
+        self.reset()
+        self._published = None
+        self._published_at = None
+
+    def add(self, value):
+        """Record a value received from the device."""
+        if self._count:
+            self._total += value
+            self._low = min(self._low, value)
+            self._high = max(self._high, value)
+        else:
+            self._total = self._low = self._high = value
+        self._count += 1
+        self._last = value
+
+    def reset(self):
+        """Forget the values received since the last publication."""
+        self._count = 0
+        self._total = self._low = self._high = self._last = None
+
+    def _value(self):
+        """Return the aggregate of the values received since publication."""
+        return self._aggregate(
+            self._count, self._total, self._low, self._high, self._last
+        )
+
+    def delay(self, now):
+        """Return the seconds until the next value is due, None if not due.
+
+        A delay of 0 means the value should be published right away.
+        """
+        if not self._count:
+            return None
+        if self._published_at is None:
+            return 0
+        elapsed = now - self._published_at
+        wait = max(0, self._min_interval - elapsed)
+        change = abs(self._value() - self._published)
+        if change > self._deadband and change > self._deadband_ratio * abs(
+            self._published
+        ):
+            return wait
+        if self._max_silence is not None:
+            return max(wait, self._max_silence - elapsed)
+        return None
+
+    def publish(self, now):
+        """Return the value to publish and start a new window."""
+        value = self._value()
+        self.reset()
+        self._published = value
+        self._published_at = now
+        return value
+
+
 class LocaltuyaSensor(LocalTuyaEntity):
     """Representation of a Tuya sensor."""
 
@@ -42,6 +230,25 @@ class LocaltuyaSensor(LocalTuyaEntity):
         """Initialize the Tuya sensor."""
         super().__init__(device, config_entry, sensorid, _LOGGER, **kwargs)
         self._state = STATE_UNKNOWN
+        self._limiter = None
+        self._limited = False
+        self._publish_timer = None
+        if any(
+            self._config.get(conf)
+            for conf in (
+                CONF_DEADBAND,
+                CONF_DEADBAND_PERCENT,
+                CONF_MIN_INTERVAL,
+                CONF_MAX_SILENCE,
+            )
+        ):
+            self._limiter = PublishLimiter(
+                self._config.get(CONF_DEADBAND) or 0,
+                self._config.get(CONF_DEADBAND_PERCENT) or 0,
+                self._config.get(CONF_MIN_INTERVAL) or 0,
+                self._config.get(CONF_MAX_SILENCE),
+                self._config.get(CONF_AGGREGATION, AGGREGATION_LAST),
+            )
 
     @property
     def state(self):
@@ -64,7 +271,43 @@ class LocaltuyaSensor(LocalTuyaEntity):
         scale_factor = self._config.get(CONF_SCALING)
         if scale_factor is not None and isinstance(state, (int, float)):
             state = round(state * scale_factor, DEFAULT_PRECISION)
-        self._state = state
+        self._limited = self._limiter is not None and _is_number(state)
+        if self._limited:
+            self._limiter.add(state)
+        else:
+            if self._limiter is not None:
+                self._limiter.reset()
+            self._state = state
+
+    def _should_update_ha_state(self):
+        """Return whether to publish the value, hold it back otherwise."""
+        if self._publish_timer is not None:
+            self._publish_timer.cancel()
+            self._publish_timer = None
+        if not self._limited:
+            return True
+        now = time.monotonic()
+        delay = self._limiter.delay(now)
+        if delay is None:
+            return False
+        if delay > 0:
+            self._publish_timer = self.hass.loop.call_later(delay, self._publish)
+            return False
+        self._state = self._limiter.publish(now)
+        return True
+
+    def _publish(self):
+        """Publish a value which was held back."""
+        self._publish_timer = None
+        self._state = self._limiter.publish(time.monotonic())
+        self.async_write_ha_state()
+
+    async def async_will_remove_from_hass(self):
+        """Cancel publishing a value which was held back."""
+        if self._publish_timer is not None:
+            self._publish_timer.cancel()
+            self._publish_timer = None
+        await super().async_will_remove_from_hass()
 
     # No need to restore state for a sensor
     async def restore_state_when_connected(self):
@@ -72,4 +315,52 @@ class LocaltuyaSensor(LocalTuyaEntity):
         return
 
 
-async_setup_entry = partial(async_setup_entry, DOMAIN, LocaltuyaSensor, flow_schema)
+class LocaltuyaDiagnosticSensor(SensorEntity):
+    """Connection statistic of a Tuya device, polled from the device."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_should_poll = True
+
+    def __init__(
+        self, device, dev_config, key, name, unit, device_class, state_class, value
+    ):
+        """Initialize the diagnostic sensor."""
+        dev_id = dev_config[CONF_DEVICE_ID]
+        self._device = device
+        self._value = value
+        self._attr_unique_id = f"local_{dev_id}_{key}"
+        self._attr_name = f"{dev_config[CONF_FRIENDLY_NAME]} {name}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_class = device_class
+        self._attr_state_class = state_class
+        self._attr_device_info = {
+            "identifiers": {(LOCALTUYA_DOMAIN, f"local_{dev_id}")}
+        }
+
+    @property
+    def native_value(self):
+        """Return the statistic."""
+        return self._value(self._device.connection_stats)
+
+
+async_setup_dp_sensors = partial(
+    async_setup_platform, DOMAIN, LocaltuyaSensor, flow_schema
+)
+
+
+async def async_setup_entry(hass, config_entry, async_add_entities):
+    """Set up DP sensors and the diagnostic sensors of devices."""
+    await async_setup_dp_sensors(hass, config_entry, async_add_entities)
+
+    device_index = hass.data[LOCALTUYA_DOMAIN][DATA_DEVICE_INDEX]
+    async_add_entities(
+        [
+            LocaltuyaDiagnosticSensor(
+                hass.data[LOCALTUYA_DOMAIN][TUYA_DEVICES][dev_id],
+                device_index.device_config(dev_id),
+                *description,
+            )
+            for dev_id in device_index.diagnostic_devices(config_entry)
+            for description in DIAGNOSTIC_SENSORS
+        ]
+    )